@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Benchmark cases: parsing and comparison of the answers of each problem type, at three input sizes.
+The small inputs are taken from TestParseAnswer and TestIsEqual, the medium and large ones are built from them """
+
+from inginious_problems_math.math_problem import MathProblem
+from inginious_problems_math.math_matrix import MathMatrixProblem
+from inginious_problems_math.math_interval import MathIntervalProblem
+from inginious_problems_math.math_set import MathSetProblem
+
+
+def polynomial(terms):
+    return "+".join("{}x^{{{}}}".format(i + 1, i) for i in range(terms))
+
+
+def factored_polynomial(terms):
+    # (x^terms - 1)/(x - 1) expanded, compared with its factored form
+    return "+".join("x^{{{}}}".format(i) for i in range(terms)), "\\frac{x^{" + str(terms) + "}-1}{x-1}"
+
+
+def nested_fraction(depth):
+    latex_str = "x"
+    for i in range(depth):
+        latex_str = "\\frac{1}{" + str(i + 1) + "+" + latex_str + "}"
+    return latex_str
+
+
+def logarithms(terms):
+    return "+".join("\\log{{x_{}}}".format(i) for i in range(terms)), "\\log{" + "".join("x_{}".format(i) for i in range(terms)) + "}"
+
+
+def trigonometry(terms):
+    return "+".join("\\cos^2{{x_{0}}}+\\sin^2{{x_{0}}}".format(i) for i in range(terms)), str(terms)
+
+
+def matrix(size):
+    return ":".join(",".join("{}x+{}".format(i, j) for j in range(size)) for i in range(size))
+
+
+def numeric_matrix(size):
+    return ":".join(",".join("\\frac{{{}}}{{{}}}".format(i, j + 1) if (i + j) % 2 else "{}.5".format(i * size + j)
+                             for j in range(size)) for i in range(size))
+
+
+def intervals(count):
+    return "\\cup".join("[{},{}+\\frac{{1}}{{2}})".format(2 * i, 2 * i) for i in range(count))
+
+
+def explicit_set(count):
+    return "{" + ",".join("\\frac{{{}}}{{2}}".format(2 * i) for i in range(count)) + "}", \
+           "{" + ",".join(str(i) for i in reversed(range(count))) + "}"
+
+
+def implicit_set(conditions):
+    return "{x|" + "\\&".join("(x>{})".format(i) for i in range(conditions)) + "|N}", "{x|x>" + str(conditions - 1) + "|N}"
+
+
+# (problem class, LaTeX inputs) of the parse_answer benchmarks
+parse_cases = {
+    "math.small": (MathProblem, ["3x^2+x+(2y+1)2y+4", "\\frac{1}{\\sqrt{3}}", "\\log_{z}{x}", "x_{12}+x_1y"]),
+    "math.medium": (MathProblem, [polynomial(10), nested_fraction(4), logarithms(5)[0], trigonometry(3)[0]]),
+    "math.large": (MathProblem, [polynomial(60), nested_fraction(20), logarithms(30)[0], trigonometry(15)[0]]),
+    "matrix.small": (MathMatrixProblem, ["1,2:3,4", "x_{12}, x_2, x_3"]),
+    "matrix.medium": (MathMatrixProblem, [matrix(4)]),
+    "matrix.large": (MathMatrixProblem, [matrix(10)]),
+    "matrix_numeric.large": (MathMatrixProblem, [numeric_matrix(20)]),
+    "interval.small": (MathIntervalProblem, ["[2,3)", "(-\\infty,3]\\cup[4,5]"]),
+    "interval.medium": (MathIntervalProblem, [intervals(5)]),
+    "interval.large": (MathIntervalProblem, [intervals(15)]),
+    "set.small": (MathSetProblem, ["{1,2,3}", "{x|(x<5)\\&(x>3)|N}"]),
+    "set.medium": (MathSetProblem, [explicit_set(10)[0], implicit_set(3)[0]]),
+    "set.large": (MathSetProblem, [explicit_set(30)[0], implicit_set(6)[0]]),
+    "set_explicit.large": (MathSetProblem, [explicit_set(300)[0]]),
+}
+
+# (problem class, problem content, [(answer, solution)]) of the is_equal benchmarks
+compare_cases = {
+    "math.small": (MathProblem, {}, [("2x", "x+x"), ("\\frac{1}{\\sqrt{3}}", "\\frac{\\sqrt{3}}{3}"),
+                                     ("\\frac{e^{x}*(x-1)^2}{(x^2+1)^2}", "\\frac{e^x*(x^2+1-2*x)}{x^4+1+2*x^2}")]),
+    "math.medium": (MathProblem, {}, [factored_polynomial(8), (nested_fraction(3), nested_fraction(3))]),
+    "math.large": (MathProblem, {}, [factored_polynomial(30), (nested_fraction(8), nested_fraction(8))]),
+    "math_log.small": (MathProblem, {"use_log": True}, [("\\log{x} + \\log{y}", "\\log{xy}")]),
+    "math_log.medium": (MathProblem, {"use_log": True}, [logarithms(5)]),
+    "math_log.large": (MathProblem, {"use_log": True}, [logarithms(15)]),
+    "math_trigo.small": (MathProblem, {"use_trigo": True}, [("\\cos^2{x} + \\sin^2{x}", "1")]),
+    "math_trigo.medium": (MathProblem, {"use_trigo": True}, [trigonometry(3)]),
+    "math_trigo.large": (MathProblem, {"use_trigo": True}, [trigonometry(8)]),
+    "math_tolerance.small": (MathProblem, {"tolerance": 0.01}, [("3.141", "\\pi"), ("2.718", "e")]),
+    "math_tolerance.medium": (MathProblem, {"tolerance": 0.01}, [(polynomial(10).replace("x", "2"), str(sum((i + 1) * 2 ** i for i in range(10))))]),
+    "math_tolerance.large": (MathProblem, {"tolerance": 0.01}, [(polynomial(20).replace("x", "1.01"), polynomial(20).replace("x", "1.01") + "+0.001")]),
+    "matrix.small": (MathMatrixProblem, {}, [("1,2:3,4", "1,2:3,4"), ("x_{12}, x_2, x_3", "x_{12}, x_2, x_3")]),
+    "matrix.medium": (MathMatrixProblem, {}, [(matrix(4), matrix(4))]),
+    "matrix.large": (MathMatrixProblem, {}, [(matrix(10), matrix(10))]),
+    "matrix_numeric.large": (MathMatrixProblem, {"tolerance": 0.01}, [(numeric_matrix(20), numeric_matrix(20))]),
+    "interval.small": (MathIntervalProblem, {}, [("[2,3)", "[2,3)"), ("[2,3)\\cup[3,4]", "[2,4]")]),
+    "interval.medium": (MathIntervalProblem, {}, [(intervals(5), intervals(5))]),
+    "interval.large": (MathIntervalProblem, {}, [(intervals(15), intervals(15))]),
+    "set.small": (MathSetProblem, {}, [("{1,2,3}", "{3,2,1}"), ("{x|(x<5)\\&(x>3)|N}", "{x|(x>3)\\&(x<5)|N}")]),
+    "set.medium": (MathSetProblem, {}, [explicit_set(10), implicit_set(3)]),
+    "set.large": (MathSetProblem, {}, [explicit_set(30), implicit_set(6)]),
+    "set_explicit.large": (MathSetProblem, {}, [explicit_set(300)]),
+}
@@ -0,0 +1,44 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Compares the hand-written LaTeX parser with sympy's parse_latex, per class of expression """
+
+import argparse
+import timeit
+
+from sympy.parsing.latex import parse_latex
+
+from inginious_problems_math import latex_parser
+
+expression_classes = {
+    "polynomial": ["3x^2+x+(2y+1)2y+4", "x^{3}-3x^{2}+3x-1", "(x+1)(x-1)", "2x+3y-4z+5"],
+    "fraction": ["\\frac{1}{\\sqrt{3}}", "\\frac{2x^x}{x^{x-1}}", "\\frac{e^x*(x^2+1-2*x)}{x^4+1+2*x^2}"],
+    "function": ["\\cos^2{x} + \\sin^2{x}", "\\log_{z}{2} + 3*\\log_{z}{x}", "\\ln{x^{2}}", "e^{i\\pi}+1"],
+    "subscript": ["x_{12}+x_1y", "2\\pi* r_1", "x+x*x_1*x_{12}-x*(x_1*x_{12}-1)"],
+    "relation": ["x^2+2x+1=0", "x \\le 3", "2x+1 \\neq 5"],
+}
+
+
+def measure(function, expressions, number):
+    """Returns the mean time, in microseconds, to parse one of the expressions"""
+    duration = timeit.timeit(lambda: [function(expression) for expression in expressions], number=number)
+    return 1e6 * duration / (number * len(expressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the LaTeX parsers")
+    parser.add_argument("-n", "--number", help="Number of runs per class", type=int, default=50)
+    args = parser.parse_args()
+
+    print("{:<12} {:>14} {:>14} {:>8}".format("class", "parse_latex", "latex_parser", "speedup"))
+    for name, expressions in expression_classes.items():
+        antlr = measure(parse_latex, expressions, args.number)
+        handwritten = measure(latex_parser.parse, expressions, args.number)
+        print("{:<12} {:>11.1f} us {:>11.1f} us {:>7.1f}x".format(name, antlr, handwritten, antlr / handwritten))
+
+
+if __name__ == "__main__":
+    main()
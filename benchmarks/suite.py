@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Times parse_answer and is_equal for every problem type and reports the median and 95th percentile
+durations along with the memory peak of each case. A saved baseline can be given, the run then fails
+when a case got slower, or uses more memory, than the baseline by more than the threshold """
+
+import argparse
+import json
+import math
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+from sympy.core.cache import clear_cache
+
+from inginious_problems_math.math_problem import parse_cache
+from benchmarks.cases import parse_cases, compare_cases
+
+
+def reset():
+    """Drops the parsed answers and the sympy cache, so that every run starts cold"""
+    parse_cache.clear()
+    clear_cache()
+
+
+def make_parse_run(problem_class, inputs):
+    return lambda: [problem_class.parse_answer(latex_str) for latex_str in inputs]
+
+
+def make_compare_run(problem_class, content, pairs):
+    problem = problem_class("benchmark", dict(content, answers=[]), {}, None)
+    answers = [(problem_class.parse_answer(answer), problem_class.parse_answer(solution)) for answer, solution in pairs]
+    return lambda: [problem.is_equal(answer, solution) for answer, solution in answers]
+
+
+def get_cases(pattern):
+    cases = {}
+    for name, (problem_class, inputs) in parse_cases.items():
+        cases["parse_answer." + name] = lambda problem_class=problem_class, inputs=inputs: make_parse_run(problem_class, inputs)
+    for name, (problem_class, content, pairs) in compare_cases.items():
+        cases["is_equal." + name] = lambda problem_class=problem_class, content=content, pairs=pairs: make_compare_run(problem_class, content, pairs)
+    return {name: factory for name, factory in cases.items() if re.search(pattern, name)}
+
+
+def percentile(values, ratio):
+    """Nearest-rank percentile"""
+    values = sorted(values)
+    return values[max(0, int(math.ceil(ratio * len(values))) - 1)]
+
+
+def measure(factory, repeat):
+    """Returns the median and 95th percentile durations of repeat cold runs, in milliseconds, and the
+    memory peak of a run, in kilobytes"""
+    run = factory()
+    durations = []
+    for _ in range(repeat):
+        reset()
+        start = time.perf_counter()
+        run()
+        durations.append(1000 * (time.perf_counter() - start))
+
+    reset()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"median": statistics.median(durations), "p95": percentile(durations, 0.95), "peak": peak / 1024}
+
+
+def get_regressions(results, baseline, threshold):
+    """Returns the (case, statistic, baseline value, value) tuples exceeding the baseline by more than the threshold"""
+    regressions = []
+    for name, result in results.items():
+        for statistic in ["median", "peak"]:
+            reference = baseline.get(name, {}).get(statistic)
+            if reference and result[statistic] > reference * threshold:
+                regressions.append((name, statistic, reference, result[statistic]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the parsing and the comparison of answers")
+    parser.add_argument("-k", "--filter", help="Only run the cases matching this regular expression", default="")
+    parser.add_argument("-r", "--repeat", help="Number of timed runs per case", type=int, default=15)
+    parser.add_argument("-s", "--save", help="Saves the results as a baseline in this file", default=None)
+    parser.add_argument("-b", "--baseline", help="Compares the results with the baseline saved in this file", default=None)
+    parser.add_argument("-t", "--threshold", help="Tolerated ratio between a result and its baseline", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = {}
+    print("{:<36} {:>12} {:>12} {:>12}".format("case", "median (ms)", "p95 (ms)", "peak (kB)"))
+    for name, factory in sorted(get_cases(args.filter).items()):
+        results[name] = measure(factory, args.repeat)
+        print("{:<36} {:>12.2f} {:>12.2f} {:>12.1f}".format(name, results[name]["median"], results[name]["p95"],
+                                                             results[name]["peak"]))
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = get_regressions(results, baseline, args.threshold)
+        for name, statistic, reference, value in regressions:
+            print("REGRESSION {} {}: {:.2f} -> {:.2f}".format(name, statistic, reference, value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,44 +3,65 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 
+import atexit
+import ipaddress
+import logging
 import os
 
-from flask import send_from_directory
-from inginious.frontend.pages.utils import INGIniousPage
-
-from inginious_problems_math.pages.hint import HintPage
+from inginious_problems_math.pages.assets import AssetPage
+from inginious_problems_math.pages.hint import HintPage, hint_cache
 from inginious_problems_math.pages.answers import AnswersPage
-from inginious_problems_math.math_problem import DisplayableMathProblem
+from inginious_problems_math.pages.metrics import MetricsPage
+from inginious_problems_math import answer_stats, assets, metrics
+from inginious_problems_math.math_problem import MathProblem, DisplayableMathProblem, configure, rendered_inputs
 from inginious_problems_math.math_matrix import DisplayableMathMatrixProblem
 from inginious_problems_math.math_interval import DisplayableMathIntervalProblem
 from inginious_problems_math.math_set import DisplayableMathSetProblem
+from inginious_problems_math.grading_pool import GradingPool
+from inginious_problems_math.verdict_store import VerdictStore
 
 __version__ = "0.1.dev0"
 
 PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
 
-class StaticMockPage(INGIniousPage):
-    def GET(self, path):
-        return send_from_directory(os.path.join(PATH_TO_PLUGIN, "static"), path)
-
-    def POST(self, path):
-        return self.GET(path)
-
 def add_admin_menu(course): # pylint: disable=unused-argument
     return 'math-answers', '<i class="fa fa-calculator fa-fw"></i>&nbsp; Math answers'
 
 def init(plugin_manager, course_factory, client, plugin_config):
-    # TODO: Replace by shared static middleware and let webserver serve the files
-    plugin_manager.add_page('/plugins/math/static/<path:path>', StaticMockPage.as_view('mathstaticpage'))
+    configure(plugin_config)
+    hint_cache.resize(plugin_config.get("hint_cache_size", 1024))
+    rendered_inputs.resize(plugin_config.get("render_cache_size", 1024),
+                           plugin_config.get("render_cache_bytes", 16 * 2 ** 20))
+    if plugin_config.get("grading_pool", None):
+        pool_config = plugin_config["grading_pool"]
+        MathProblem.grading_pool = GradingPool(pool_config.get("workers", 2), pool_config.get("timeout", 10),
+                                               pool_config.get("memory_limit", None),
+                                               pool_config.get("max_checks", None), plugin_config)
+        atexit.register(MathProblem.grading_pool.close)
+    if plugin_config.get("verdict_store", None):
+        store_config = plugin_config["verdict_store"]
+        MathProblem.verdict_store = VerdictStore(store_config["path"], store_config.get("max_entries", 100000))
+    if plugin_config.get("metrics", None):
+        metrics_config = plugin_config["metrics"]
+        if metrics_config.get("sink", "histogram") == "log":
+            metrics.set_sink(metrics.LoggingSink(logging.getLevelName(metrics_config.get("level", "DEBUG"))))
+        else:
+            metrics.set_sink(metrics.HistogramSink(metrics_config.get("buckets", metrics.HistogramSink.default_buckets)))
+            MetricsPage.token = metrics_config.get("token", None)
+            MetricsPage.allowed_networks = [ipaddress.ip_network(address, strict=False)
+                                            for address in metrics_config.get("allowed_addresses", [])]
+            plugin_manager.add_page('/plugins/math/metrics', MetricsPage.as_view('mathmetricspage'))
+    AssetPage.assets = assets.Assets(plugin_config.get("assets_directory", assets.default_directory))
+    plugin_manager.add_page('/plugins/math/assets/<filename>', AssetPage.as_view('mathassetpage'))
     plugin_manager.add_page('/plugins/math/hint', HintPage.as_view('mathhintpage'))
     plugin_manager.add_page('/admin/<courseid>/math-answers', AnswersPage.as_view('mathanswerspage'))
-    plugin_manager.add_hook("css", lambda: "/plugins/math/static/mathquill.css")
-    plugin_manager.add_hook("css", lambda: "/plugins/math/static/matheditor.css")
-    plugin_manager.add_hook("javascript_header", lambda: "/plugins/math/static/mathquill.min.js")
-    plugin_manager.add_hook("javascript_header", lambda: "/plugins/math/static/math.js")
-    plugin_manager.add_hook("javascript_header", lambda: "/plugins/math/static/matheditor.js")
+    plugin_manager.add_hook("css", lambda: "/plugins/math/assets/" + AssetPage.assets.get_name("math.css"))
+    plugin_manager.add_hook("javascript_header", lambda: "/plugins/math/assets/" + AssetPage.assets.get_name("math.js"))
     plugin_manager.add_hook('course_admin_menu', add_admin_menu)
+    answer_stats.create_indexes(plugin_manager.get_database())
+    plugin_manager.add_hook('submission_done', lambda submission, archive, newsub: answer_stats.submission_done(
+        plugin_manager.get_database(), course_factory, submission, newsub))
     course_factory.get_task_factory().add_problem_type(DisplayableMathProblem)
     course_factory.get_task_factory().add_problem_type(DisplayableMathMatrixProblem)
     course_factory.get_task_factory().add_problem_type(DisplayableMathIntervalProblem)
@@ -0,0 +1,230 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Per (course, task, problem, answer) submission counters of the math problems, maintained when a
+submission is done and read by the "Math answers" page. Each answer is also assigned to the cluster of its
+equivalent answers (see clustering), stored with its counter, in a background thread after the submission or
+by the backfill. The documents also hold the inputs and the key of
+the problem state (see state), to be queried by the database. Run as a script to build them from the past submissions """
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from inginious_problems_math import clustering, state as problem_state
+from inginious_problems_math.math_problem import MathProblem
+
+collection_name = "math_answers"
+# Clusters the answers of the new submissions, one task at a time, out of the threads of INGInious
+clustering_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="math-clustering")
+
+
+def create_indexes(database):
+    collection = database[collection_name]
+    collection.create_index([("courseid", ASCENDING), ("taskid", ASCENDING), ("problemid", ASCENDING),
+                             ("answer", ASCENDING)], unique=True)
+    collection.create_index([("courseid", ASCENDING), ("taskid", ASCENDING), ("problemid", ASCENDING),
+                             ("count", DESCENDING), ("answer", ASCENDING)])
+    collection.create_index([("courseid", ASCENDING), ("taskid", ASCENDING), ("problemid", ASCENDING),
+                             ("cluster_settings", ASCENDING), ("representative", ASCENDING)])
+    collection.create_index([("courseid", ASCENDING), ("taskid", ASCENDING), ("problemid", ASCENDING),
+                             ("key", ASCENDING)])
+    collection.create_index([("courseid", ASCENDING), ("taskid", ASCENDING), ("problemid", ASCENDING),
+                             ("cluster", ASCENDING), ("count", DESCENDING)])
+
+
+def get_answers(state, problemids):
+    """Returns the states of the given problems stored in a task state, as a dict problem id -> problem state
+    of the current version (see state). The states kept from a previous submission are left out"""
+    try:
+        states = json.loads(state or "{}")
+    except ValueError:
+        return {}
+    if not isinstance(states, dict):
+        return {}
+    answers = {}
+    for problemid in problemids:
+        answer = problem_state.read_state(states.get(problemid))
+        if answer is not None and not answer.get("kept"):
+            answers[problemid] = answer
+    return answers
+
+
+def get_state_fields(answer):
+    """Returns the fields of the document of an answer taken from its state. A key missing from a state of the
+    first version does not erase the one of a newer state of the same answer"""
+    fields = {"inputs": answer["inputs"]}
+    if answer["key"] is not None:
+        fields["key"] = answer["key"]
+    return fields
+
+
+def add_answers(database, courseid, taskid, answers):
+    """Increments the counters of the answers, a dict problem id -> problem state of any version. The answer
+    counted is the JSON list of the inputs of the state"""
+    requests = []
+    for problemid, answer in answers.items():
+        answer = problem_state.read_state(answer)
+        if answer is None:
+            continue
+        fields = get_state_fields(answer)
+        requests.append(UpdateOne({"courseid": courseid, "taskid": taskid, "problemid": problemid,
+                                   "answer": problem_state.get_answer(answer)},
+                                  {"$inc": {"count": 1}, "$set": fields}, upsert=True))
+    if requests:
+        database[collection_name].bulk_write(requests, ordered=False)
+
+
+def submission_done(database, course_factory, submission, newsub):
+    """submission_done hook: counts the answers of the math problems of a new submission, and clusters them in
+    the background. Replayed submissions keep the same input and are already counted"""
+    if not newsub or submission.get("status") != "done":
+        return
+    try:
+        task = course_factory.get_task(submission["courseid"], submission["taskid"])
+    except Exception:
+        return
+    problems = [problem for problem in task.get_problems() if isinstance(problem, MathProblem)]
+    answers = get_answers(submission.get("state"), [problem.get_id() for problem in problems])
+    add_answers(database, submission["courseid"], submission["taskid"], answers)
+    if answers:
+        clustering_executor.submit(cluster_task, database, submission["courseid"], submission["taskid"],
+                                   [problem for problem in problems if problem.get_id() in answers])
+
+
+def cluster_task(database, courseid, taskid, problems):
+    """Clusters the new answers of the given problems of a task, logging the errors"""
+    try:
+        cluster_answers(database, courseid, {taskid: problems})
+    except Exception:
+        logging.getLogger("inginious.webapp.plugin.math").exception("Cannot cluster the answers of %s/%s",
+                                                                     courseid, taskid)
+
+
+def cluster_answers(database, courseid, problems):
+    """Assigns the answers of the given problems, a dict task id -> list of problems, to their cluster. Only
+    the answers that are new, or whose cluster was computed with other problem settings, are processed.
+    Returns the number of answers processed"""
+    collection = database[collection_name]
+    processed = 0
+    for taskid, task_problems in problems.items():
+        for problem in task_problems:
+            settings = clustering.get_settings_hash(problem)
+            query = {"courseid": courseid, "taskid": taskid, "problemid": problem.get_id()}
+            pending = [document["answer"] for document in collection.find(
+                dict(query, cluster_settings={"$ne": settings}), {"answer": 1}).sort([("count", DESCENDING),
+                                                                                       ("answer", ASCENDING)])]
+            if not pending:
+                continue
+            representatives = {}
+            for document in collection.find(dict(query, cluster_settings=settings, representative=True),
+                                            {"answer": 1, "fingerprint": 1}).sort("answer", ASCENDING):
+                representatives.setdefault(document["fingerprint"], []).append(document["answer"])
+
+            assignments = clustering.assign_clusters(problem, pending, representatives)
+            requests = [UpdateOne(dict(query, answer=answer),
+                                  {"$set": {"cluster": cluster, "fingerprint": fingerprint, "cluster_settings": settings,
+                                            "representative": cluster == answer}})
+                        for answer, (cluster, fingerprint) in assignments.items()]
+            collection.bulk_write(requests, ordered=False)
+            processed += len(requests)
+    return processed
+
+
+def get_top_answers(database, courseid, taskids=None, limit=5, variant_limit=10):
+    """Returns the limit most frequent answers of each math problem of a course, or of the given tasks, as a dict
+    task id -> problem id -> list of (answer, count, variants). Equivalent answers are merged if they were
+    clustered: answer is then the representative of the cluster, count the total of its answers and variants
+    the variant_limit most frequent of these answers. Answers are the JSON lists of the student answers"""
+    collection = database[collection_name]
+    match = {"courseid": courseid}
+    if taskids is not None:
+        match["taskid"] = {"$in": list(taskids)}
+    problems = collection.aggregate([{"$match": match},
+                                     {"$group": {"_id": {"taskid": "$taskid", "problemid": "$problemid"}}}])
+    top_answers = {}
+    for item in problems:
+        query = {"courseid": courseid, "taskid": item["_id"]["taskid"], "problemid": item["_id"]["problemid"]}
+        clusters = collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": {"$ifNull": ["$cluster", "$answer"]}, "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit}
+        ], allowDiskUse=True)
+        answers = []
+        for cluster in clusters:
+            # The answers not clustered yet are their own cluster
+            variants = collection.find(dict(query, **{"$or": [{"cluster": cluster["_id"]},
+                                                              {"cluster": None, "answer": cluster["_id"]}]}),
+                                       {"answer": 1}).sort([("count", DESCENDING), ("answer", ASCENDING)])
+            answers.append((cluster["_id"], cluster["count"],
+                            sorted(document["answer"] for document in variants.limit(variant_limit))))
+        top_answers.setdefault(query["taskid"], {})[query["problemid"]] = answers
+    return top_answers
+
+
+def backfill_task(database, courseid, taskid, problemids, batch_size=500):
+    """Rebuilds the counters of a task from its past submissions. Returns the number of submissions read"""
+    counts = {}
+    fields = {}
+    submissions = 0
+    cursor = database.submissions.find({"courseid": courseid, "taskid": taskid, "status": "done"}, {"state": 1},
+                                       batch_size=batch_size)
+    for submission in cursor:
+        submissions += 1
+        for problemid, answer in get_answers(submission.get("state"), problemids).items():
+            identity = (problemid, problem_state.get_answer(answer))
+            counts[identity] = counts.get(identity, 0) + 1
+            fields.setdefault(identity, {}).update(get_state_fields(answer))
+
+    collection = database[collection_name]
+    collection.delete_many({"courseid": courseid, "taskid": taskid})
+    documents = [dict(fields[(problemid, answer)], courseid=courseid, taskid=taskid, problemid=problemid,
+                      answer=answer, count=count) for (problemid, answer), count in counts.items()]
+    for i in range(0, len(documents), batch_size):
+        collection.insert_many(documents[i:i + batch_size], ordered=False)
+    return submissions
+
+
+def main():
+    from pymongo import MongoClient
+    from inginious_problems_math.regrade import get_config, load_task_problems
+
+    parser = argparse.ArgumentParser(description="Builds the answer counters of the math problems from the past submissions")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("course", help="Course to process (all the courses if omitted)", nargs="?", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    logger = logging.getLogger("inginious.math.answer_stats")
+
+    config = get_config(args.config)
+    mongo_client = MongoClient(host=config.get('mongo_opt', {}).get('host', 'localhost'))
+    database = mongo_client[config.get('mongo_opt', {}).get('database', 'INGInious')]
+    tasks_directory = config.get("tasks_directory", "./tasks")
+    create_indexes(database)
+
+    courseids = [args.course] if args.course else sorted(
+        courseid for courseid in os.listdir(tasks_directory) if os.path.isdir(os.path.join(tasks_directory, courseid)))
+    for courseid in courseids:
+        for taskid in sorted(os.listdir(os.path.join(tasks_directory, courseid))):
+            if not os.path.isfile(os.path.join(tasks_directory, courseid, taskid, "task.yaml")):
+                continue
+            problems = [problem for problem in load_task_problems(tasks_directory, courseid, taskid)
+                        if problem is not None]
+            if problems:
+                submissions = backfill_task(database, courseid, taskid, [problem.get_id() for problem in problems])
+                logger.info("%s/%s: %s submissions counted", courseid, taskid, submissions)
+                answers = cluster_answers(database, courseid, {taskid: problems})
+                logger.info("%s/%s: %s answers clustered", courseid, taskid, answers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Static files of the plugin, built once in a directory: the scripts bundled in math.js, the stylesheets in
+math.css, and the fonts they use. Each file is named after a hash of its content, so that browsers may keep it
+forever, and is stored along with its gzip (and brotli, if installed) compressed variants. The files found in
+the directory are checked against the sources before being served, and the directory must not be writable by
+other users. Run as a script to build them ahead of time """
+
+import argparse
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
+PATH_TO_STATIC = os.path.join(PATH_TO_PLUGIN, "static")
+# Private to the user running INGInious, the temporary directory being shared
+default_directory = os.path.join(tempfile.gettempdir(), "inginious-math-assets-{}".format(os.getuid()))
+
+# Bundles and the files they are made of, in their loading order
+bundles = {
+    "math.js": ["mathquill.min.js", "math.js", "matheditor.js"],
+    "math.css": ["mathquill.css", "matheditor.css"],
+}
+font_folder = "font"
+font_url_pattern = re.compile(r"url\(" + font_folder + r"/([^)#?]+)")
+# Compressed variants, in the order they are preferred, with their file extension
+encodings = [("br", ".br"), ("gzip", ".gz")]
+# Files already compressed, and largest size of a compressed variant of the other ones, relative to the file
+compressed_extensions = {".woff", ".woff2"}
+compression_ratio = 0.9
+
+
+def get_hashed_name(name, content):
+    base, extension = os.path.splitext(name)
+    return "{}.{}{}".format(base, hashlib.sha256(content).hexdigest()[:16], extension)
+
+
+def compress(encoding, content):
+    if encoding == "br":
+        return brotli.compress(content) if brotli is not None else None
+    # No timestamp, so that the variants of a file are the same whenever they are built
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def decompress(encoding, content):
+    """Returns the decompressed content of a variant, or None if it is not a valid one"""
+    try:
+        if encoding == "br":
+            return brotli.decompress(content) if brotli is not None else None
+        return gzip.decompress(content)
+    except Exception:
+        return None
+
+
+def read_file(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def check_directory(directory):
+    """Creates the directory if needed, and checks that no other user may write its files"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status = os.stat(directory)
+    if status.st_uid not in [os.getuid(), 0] or status.st_mode & 0o022:
+        raise PermissionError("The assets directory {} must belong to the user running INGInious and not be "
+                              "writable by the other users".format(directory))
+
+
+def write_file(directory, filename, content):
+    """Writes a file atomically, unless it already holds this content"""
+    path = os.path.join(directory, filename)
+    if read_file(path) == content:
+        return
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".")
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(content)
+    # The web server may serve them directly
+    os.chmod(temporary_path, 0o644)
+    os.replace(temporary_path, path)
+
+
+class Assets(object):
+    """The static files built in a directory. names maps the name of a bundle or a font (such as math.css or
+    font/Symbola.ttf) to the name of its file, and files maps these to the encodings they are available in"""
+
+    def __init__(self, directory=default_directory):
+        self._directory = directory
+        self.names = {}
+        self.files = {}
+        check_directory(directory)
+
+        font_directory = os.path.join(PATH_TO_STATIC, font_folder)
+        for font in sorted(os.listdir(font_directory)):
+            with open(os.path.join(font_directory, font), "rb") as file:
+                self.add(font_folder + "/" + font, file.read())
+
+        for bundle, sources in sorted(bundles.items()):
+            contents = []
+            for source in sources:
+                with open(os.path.join(PATH_TO_STATIC, source), "r", encoding="utf-8") as file:
+                    contents.append(file.read())
+            if bundle.endswith(".js"):
+                # A script not ending with a semicolon must not run into the next one
+                content = "\n;\n".join(contents)
+            else:
+                content = font_url_pattern.sub(self.get_font_url, "\n".join(contents))
+            self.add(bundle, content.encode("utf-8"))
+
+    def get_font_url(self, match):
+        """The fonts are served next to the bundle. Missing fonts are left as is"""
+        font = font_folder + "/" + match.group(1)
+        return "url(" + self.names.get(font, font)
+
+    def add(self, name, content):
+        filename = get_hashed_name(os.path.basename(name), content)
+        write_file(self._directory, filename, content)
+        available = ["identity"]
+        if os.path.splitext(name)[1] not in compressed_extensions:
+            for encoding, extension in encodings:
+                # Files are reused, without compressing them again, only if they decompress to the content
+                existing = read_file(os.path.join(self._directory, filename + extension))
+                if existing is not None and decompress(encoding, existing) == content:
+                    available.append(encoding)
+                    continue
+                compressed = compress(encoding, content)
+                if compressed is not None and len(compressed) < compression_ratio * len(content):
+                    write_file(self._directory, filename + extension, compressed)
+                    available.append(encoding)
+        self.names[name] = filename
+        self.files[filename] = available
+
+    def get_name(self, name):
+        return self.names[name]
+
+    def negotiate(self, filename, accept_encodings):
+        """Returns the path of the variant of a file to send, and its encoding, given the qualities of the
+        encodings accepted by the client (a werkzeug Accept), or None if there is no such file"""
+        available = self.files.get(filename)
+        if available is None:
+            return None
+        for encoding, extension in encodings:
+            if encoding in available and accept_encodings.quality(encoding) > 0:
+                return os.path.join(self._directory, filename + extension), encoding
+        return os.path.join(self._directory, filename), "identity"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the static files of the math problems, to be served by "
+                                                 "the plugin or the web server")
+    parser.add_argument("directory", help="Directory of the built files (the assets_directory of the plugin)",
+                        nargs="?", default=default_directory)
+    args = parser.parse_args()
+    assets = Assets(args.directory)
+    for name, filename in sorted(assets.names.items()):
+        print("{}: {} ({})".format(name, filename, ", ".join(assets.files[filename])))
+
+
+if __name__ == "__main__":
+    main()
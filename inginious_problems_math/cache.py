@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import sys
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A bounded, thread-safe mapping that drops its least recently used entries first.
+    Lookups and evictions are counted so the bound can be sized from production figures."""
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        """Returns the value stored for key (marking it as recently used), or default"""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self._misses += 1
+                return default
+            self._hits += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        """Stores value for key, evicting the least recently used entries if needed"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize):
+        """Changes the bound of the cache, evicting entries if it shrinks"""
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self._evictions += 1
+
+    def stats(self):
+        """Returns the hit, miss and eviction counters along with the current size"""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+                    "size": len(self._data), "maxsize": self._maxsize}
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SizedLRUCache(LRUCache):
+    """An LRUCache also bounded by the total size of its values, in bytes as measured by sizeof"""
+
+    def __init__(self, maxsize=128, maxbytes=2 ** 24, sizeof=sys.getsizeof):
+        super().__init__(maxsize)
+        self._maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._bytes = 0
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizeof(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._bytes += size
+            self._evict()
+
+    def resize(self, maxsize, maxbytes=None):
+        """Changes the bounds of the cache, evicting entries if it shrinks"""
+        with self._lock:
+            self._maxsize = maxsize
+            if maxbytes is not None:
+                self._maxbytes = maxbytes
+            self._evict()
+
+    def _evict(self):
+        while len(self._data) > self._maxsize or (self._data and self._bytes > self._maxbytes):
+            __, value = self._data.popitem(last=False)
+            self._bytes -= self._sizeof(value)
+            self._evictions += 1
+
+    def stats(self):
+        """Returns the counters of LRUCache.stats along with the total size of the values and its bound"""
+        stats = super().stats()
+        with self._lock:
+            stats.update(bytes=self._bytes, maxbytes=self._maxbytes)
+        return stats
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._hits = self._misses = self._evictions = 0
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Groups the equivalent answers given to a math problem. Answers are bucketed by their fingerprint, and only
+compared symbolically within a bucket """
+
+import hashlib
+import json
+
+# Version of the fingerprints, stored with the clusters
+version = 1
+
+
+def get_settings_hash(problem):
+    """Returns a hash of the settings the clusters of the answers of a problem depend on"""
+    return hashlib.sha256(json.dumps([version, problem.get_comparison_signature()]).encode("utf-8")).hexdigest()
+
+
+def get_entries(problem, answer):
+    """Returns the entries (see MathProblem.make_entry) of an answer, a JSON list of LaTeX strings as stored
+    in the problem state, or None if it cannot be parsed"""
+    try:
+        answers = problem.sort([problem.parse_answer(latex_str) for latex_str in json.loads(answer)])
+        return [problem.make_entry(eq) for eq in answers]
+    except Exception:
+        return None
+
+
+def get_fingerprint(problem, answer, entries):
+    """Returns the bucket of an answer: the keys of the fingerprints of its parsed answers. Answers without
+    fingerprint are bucketed by their parsed form, and those that cannot be parsed by their LaTeX"""
+    if entries is None:
+        return "latex:" + answer
+    fingerprints = [problem.get_fingerprint(entry["answer"]) for entry in entries]
+    if any(fingerprint is None for fingerprint in fingerprints):
+        return "parsed:" + json.dumps([str(entry["answer"]) for entry in entries])
+    return "fingerprint:" + json.dumps([fingerprint.key for fingerprint in fingerprints])
+
+
+def are_equivalent(problem, entries1, entries2):
+    if entries1 is None or entries2 is None or len(entries1) != len(entries2):
+        return False
+    try:
+        return all(problem.compare_entries(entry1, entry2) for entry1, entry2 in zip(entries1, entries2))
+    except Exception:
+        return False
+
+
+def assign_clusters(problem, answers, representatives):
+    """Assigns a cluster to each answer, most frequent first. representatives maps a fingerprint to the
+    answers representing the existing clusters of that bucket, and is updated with the new clusters.
+    Returns a dict answer -> (representative of its cluster, fingerprint)"""
+    entries = {}
+    assignments = {}
+    for answer in answers:
+        entries[answer] = get_entries(problem, answer)
+        fingerprint = get_fingerprint(problem, answer, entries[answer])
+        bucket = representatives.setdefault(fingerprint, [])
+        cluster = answer
+        for representative in bucket:
+            if representative not in entries:
+                entries[representative] = get_entries(problem, representative)
+            if are_equivalent(problem, entries[answer], entries[representative]):
+                cluster = representative
+                break
+        if cluster == answer:
+            bucket.append(answer)
+        assignments[answer] = (cluster, fingerprint)
+    return assignments
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Fingerprints of parsed answers: their values at fixed pseudo-random points. Equal answers share their
+fingerprint, so that an answer only has to be compared with the answers in its bucket of a FingerprintIndex.
+Different answers may share it too: the candidates of a bucket still have to be confirmed with is_equal """
+
+import functools
+import random
+import zlib
+from collections import namedtuple
+
+import mpmath
+from sympy import Expr, Float
+
+# Number of points per fingerprint
+point_count = 3
+# Precision of the evaluation, and significant digits of the key: the digits of equal answers agree far beyond
+# the rounding, which therefore does not split their bucket
+precision = 30
+key_digits = 12
+# Rational functions are also evaluated exactly, at integer points modulo this prime
+prime = 2 ** 61 - 1
+
+context = mpmath.MPContext()
+context.dps = precision
+
+functions = {
+    "sin": context.sin, "cos": context.cos, "tan": context.tan, "cot": context.cot, "sec": context.sec,
+    "csc": context.csc, "asin": context.asin, "acos": context.acos, "atan": context.atan, "acot": context.acot,
+    "sinh": context.sinh, "cosh": context.cosh, "tanh": context.tanh, "asinh": context.asinh,
+    "acosh": context.acosh, "atanh": context.atanh, "exp": context.exp, "Abs": context.fabs,
+    "factorial": context.factorial, "gamma": context.gamma,
+    # The parser keeps two-argument logarithms unevaluated
+    "log": lambda x, base=None: context.log(x) if base is None else context.log(x, base),
+}
+
+# The key identifies the bucket. The residues, modulo prime, are only computed for rational functions: two
+# answers whose residues differ are not equal even if their keys collide
+Fingerprint = namedtuple("Fingerprint", ["key", "residues"])
+
+
+class NotRational(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=1024)
+def symbol_points(name):
+    """Returns the points of a symbol, as (integers modulo prime, reals in [0.5, 2.5)). They only depend on
+    the symbol name, so that fingerprints are comparable between answers and processes"""
+    rng = random.Random(zlib.crc32(name.encode("utf-8")))
+    integers = tuple(rng.randrange(2, prime) for _ in range(point_count))
+    reals = tuple(context.mpf(rng.randrange(2 ** 20, 5 * 2 ** 20)) / 2 ** 21 for _ in range(point_count))
+    return integers, reals
+
+
+def inverse(value):
+    if value % prime == 0:
+        raise ZeroDivisionError
+    return pow(value, prime - 2, prime)
+
+
+def get_residues(eq):
+    """Returns the values of a rational function with rational coefficients at the integer points, modulo prime"""
+    if eq.is_Symbol:
+        return symbol_points(eq.name)[0]
+    if eq.is_Rational:
+        return (eq.p * inverse(eq.q) % prime,) * point_count
+    if eq.is_Add or eq.is_Mul:
+        values = get_residues(eq.args[0])
+        for arg in eq.args[1:]:
+            if eq.is_Add:
+                values = tuple((a + b) % prime for a, b in zip(values, get_residues(arg)))
+            else:
+                values = tuple(a * b % prime for a, b in zip(values, get_residues(arg)))
+        return values
+    if eq.is_Pow and eq.exp.is_Integer:
+        exponent = int(eq.exp)
+        values = get_residues(eq.base)
+        if exponent < 0:
+            values = tuple(inverse(value) for value in values)
+        return tuple(pow(value, abs(exponent), prime) for value in values)
+    raise NotRational
+
+
+def to_context(number):
+    # Infinite and undefined parts are not sympy Floats
+    parts = [Float(part, precision) for part in number.evalf(precision).as_real_imag()]
+    return context.mpc(*[part._mpf_ if part.is_Float else float(part) for part in parts])
+
+
+def get_values(eq):
+    """Returns the values of eq at the real points"""
+    if eq.is_Symbol:
+        return symbol_points(eq.name)[1]
+    if eq.is_Rational:
+        return (context.mpf(eq.p) / eq.q,) * point_count
+    if eq.is_Float:
+        return (context.mpf(eq._mpf_),) * point_count
+    if eq.is_number:
+        return (to_context(eq),) * point_count
+    args = [get_values(arg) for arg in eq.args]
+    if eq.is_Add:
+        return tuple(context.fsum(values) for values in zip(*args))
+    if eq.is_Mul:
+        return tuple(context.fprod(values) for values in zip(*args))
+    if eq.is_Pow:
+        return tuple(context.power(base, exponent) for base, exponent in zip(*args))
+    function = functions.get(type(eq).__name__)
+    if function is None:
+        # Uncommon nodes are left to sympy
+        return tuple(to_context(eq.subs({symbol: Float(symbol_points(symbol.name)[1][i], precision)
+                                         for symbol in eq.free_symbols})) for i in range(point_count))
+    return tuple(function(*values) for values in zip(*args))
+
+
+# Numbers have the same value at every point
+@functools.lru_cache(maxsize=4096)
+def format_value(value):
+    parts = []
+    for part in [value.real, value.imag]:
+        # Rounding errors must not make a zero part differ from another
+        if abs(part) <= abs(value) * 10 ** (key_digits - precision):
+            part = 0
+        parts.append(context.nstr(part, key_digits))
+    return ",".join(parts)
+
+
+def get_fingerprint(eq):
+    """Returns the fingerprint of a sympy expression, or None if it cannot be evaluated at the points"""
+    if not isinstance(eq, Expr) or getattr(eq, "is_Matrix", False):
+        return None
+    try:
+        values = get_values(eq)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if not all(context.isfinite(value) for value in values):
+        return None
+    try:
+        residues = get_residues(eq)
+    except (NotRational, ZeroDivisionError):
+        residues = None
+    return Fingerprint(";".join(format_value(value) for value in values), residues)
+
+
+def may_be_equal(fingerprint1, fingerprint2):
+    """Tells if the answers of two fingerprints may be equal. None, an unknown fingerprint, may be equal to any"""
+    if fingerprint1 is None or fingerprint2 is None:
+        return True
+    if fingerprint1.key != fingerprint2.key:
+        return False
+    return fingerprint1.residues is None or fingerprint2.residues is None or fingerprint1.residues == fingerprint2.residues
+
+
+class FingerprintIndex(object):
+    """Maps fingerprints to the items of the answers they were computed from, to find the items an answer may be
+    equal to without comparing it with all of them. Items without fingerprint are candidates of every lookup"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._unknown = []
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, fingerprint, item):
+        position = len(self._items)
+        self._items.append(item)
+        if fingerprint is None:
+            self._unknown.append((position, fingerprint, item))
+        else:
+            self._buckets.setdefault(fingerprint.key, []).append((position, fingerprint, item))
+
+    def candidates(self, fingerprint):
+        """Returns the items that may be equal to the answer of the fingerprint, in the order they were added"""
+        if fingerprint is None:
+            return list(self._items)
+        matches = [(position, item) for position, other, item in self._buckets.get(fingerprint.key, [])
+                   if may_be_equal(fingerprint, other)]
+        if self._unknown:
+            matches = sorted(matches + [(position, item) for position, _, item in self._unknown])
+        return [item for _, item in matches]
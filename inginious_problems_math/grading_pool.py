@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Pool of worker processes grading math answers with a hard deadline per check """
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+
+def _worker_main(conn, memory_limit, config):
+    """Main loop of a worker: receives (problem class, problem id, content, student inputs) and sends back
+    the result of the problem grade method. The worker is a new interpreter: the plugin configuration the
+    grading depends on is applied again"""
+    if memory_limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit * 1024 * 1024, memory_limit * 1024 * 1024))
+    from inginious_problems_math.math_problem import configure
+    configure(config)
+
+    while True:
+        try:
+            problem_class, problemid, content, student_inputs = conn.recv()
+        except EOFError:
+            return
+        try:
+            problem = problem_class(problemid, content, {}, None)
+            conn.send(problem.grade(student_inputs))
+        except Exception as e:
+            conn.send(("error", str(e), None))
+
+
+class GradingPool(object):
+    """Runs MathProblem.grade in worker processes. A check that exceeds the timeout (in seconds), including the
+    wait for an idle worker, gets a "timeout" verdict and its worker is killed and replaced. memory_limit caps
+    the address space of each worker, in megabytes, and a worker is replaced after max_checks checks (None for
+    never), which releases the memory it keeps. config is the plugin configuration, applied by the workers"""
+
+    def __init__(self, workers=2, timeout=10, memory_limit=None, max_checks=None, config=None):
+        self._logger = logging.getLogger("inginious.webapp.plugin.math")
+        self._context = multiprocessing.get_context("spawn")
+        self._timeout = timeout
+        self._memory_limit = memory_limit
+        self._max_checks = max_checks
+        self._config = config or {}
+        self._lock = threading.Lock()
+        self._workers = []
+        # Number of checks made by each worker
+        self._checks = {}
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self._memory_limit, self._config),
+                                        daemon=True)
+        process.start()
+        child_conn.close()
+        worker = (process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+            self._checks[worker] = 0
+        return worker
+
+    def _replace_worker(self, worker):
+        process, conn = worker
+        process.kill()
+        process.join()
+        conn.close()
+        with self._lock:
+            self._workers.remove(worker)
+            del self._checks[worker]
+        return self._start_worker()
+
+    def grade(self, problem, student_inputs):
+        """Grades the inputs of a student for the given problem, see MathProblem.grade"""
+        deadline = time.monotonic() + self._timeout
+        try:
+            worker = self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            self._logger.warning("No grading worker available for %s after %ss", problem.get_id(), self._timeout)
+            return "timeout", None, None
+        try:
+            process, conn = worker
+            try:
+                conn.send((type(problem), problem.get_id(), problem.get_original_content(), student_inputs))
+                if conn.poll(max(deadline - time.monotonic(), 0)):
+                    result = conn.recv()
+                    self._checks[worker] += 1
+                    if self._max_checks and self._checks[worker] >= self._max_checks:
+                        worker = self._replace_worker(worker)
+                    return result
+                self._logger.warning("Grading of %s timed out after %ss, restarting worker", problem.get_id(), self._timeout)
+            except (EOFError, OSError):
+                # The worker died while grading, most likely because of its memory cap
+                self._logger.warning("Grading worker died while grading %s, restarting worker", problem.get_id())
+            worker = self._replace_worker(worker)
+            return "timeout", None, None
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """Kills all the workers"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._checks.clear()
+        for process, conn in workers:
+            process.kill()
+            process.join()
+            conn.close()
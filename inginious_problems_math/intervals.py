@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Normalized unions of intervals: the sorted tuple of their disjoint (left, right, left_open, right_open)
+intervals, whose bounds are compared through their numerical values. Infinite bounds are infinite values """
+
+from sympy import EmptySet, FiniteSet, Interval, Union
+
+from inginious_problems_math.fingerprint import context, to_context
+
+# Significant digits kept from the values of the bounds: equal bounds written differently agree far beyond them,
+# and their values are then compared exactly
+bound_digits = 25
+
+
+def decompose(eq):
+    """Returns the (left, right, left_open, right_open) intervals of a sympy set, or None if it is not a union
+    of intervals and points"""
+    if eq is EmptySet:
+        return []
+    if isinstance(eq, Interval):
+        return [(eq.left, eq.right, eq.left_open, eq.right_open)]
+    if isinstance(eq, FiniteSet):
+        return [(element, element, False, False) for element in eq.args]
+    if isinstance(eq, Union):
+        intervals = []
+        for arg in eq.args:
+            arg_intervals = decompose(arg)
+            if arg_intervals is None:
+                return None
+            intervals += arg_intervals
+        return intervals
+    return None
+
+
+class Bound(object):
+    """A bound of an interval: its expression, for display, and its value, a real mpmath number rounded to
+    bound_digits, infinite for the infinite bounds"""
+    __slots__ = ("expr", "value")
+
+    def __init__(self, expr, value):
+        self.expr = expr
+        self.value = value
+
+    def is_finite(self):
+        return not context.isinf(self.value)
+
+
+def get_bound(expr):
+    """Returns the Bound of an expression, or None if it is not a real number"""
+    if expr.free_symbols:
+        return None
+    try:
+        value = to_context(expr)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if value.imag != 0 or context.isnan(value.real):
+        return None
+    value = value.real
+    if not context.isinf(value):
+        value = context.mpf(context.nstr(value, bound_digits))
+    return Bound(expr, value)
+
+
+def normalize(intervals):
+    """Returns the union of (left, right, left_open, right_open) intervals, as the sorted tuple of its disjoint
+    intervals, with Bound bounds. Infinite bounds are open. Returns None if a bound is not a real number"""
+    if intervals is None:
+        return None
+    bounded = []
+    for left, right, left_open, right_open in intervals:
+        left, right = get_bound(left), get_bound(right)
+        if left is None or right is None:
+            return None
+        left_open = left_open or context.isinf(left.value)
+        right_open = right_open or context.isinf(right.value)
+        # Empty intervals
+        if left.value > right.value or (left.value == right.value and (left_open or right_open)):
+            continue
+        bounded.append((left, right, left_open, right_open))
+
+    bounded.sort(key=lambda interval: (interval[0].value, interval[2]))
+    merged = []
+    for left, right, left_open, right_open in bounded:
+        if merged:
+            last_left, last_right, last_left_open, last_right_open = merged[-1]
+            if left.value < last_right.value or (left.value == last_right.value and not (left_open and last_right_open)):
+                if right.value > last_right.value:
+                    merged[-1] = (last_left, right, last_left_open, right_open)
+                elif right.value == last_right.value:
+                    merged[-1] = (last_left, last_right, last_left_open, last_right_open and right_open)
+                continue
+        merged.append((left, right, left_open, right_open))
+    return tuple(merged)
+
+
+def to_sympy(intervals):
+    """Returns the sympy set of normalized intervals. They are disjoint and sorted, which sympy does not have to check"""
+    sets = [Interval(left.expr, right.expr, left_open, right_open) for left, right, left_open, right_open in intervals]
+    if not sets:
+        return EmptySet
+    if len(sets) == 1:
+        return sets[0]
+    return Union(*sets, evaluate=False)
+
+
+def get_key(intervals, digits):
+    """Returns a string identifying normalized intervals, their bounds being rounded to digits"""
+    return "\\cup".join("{}{},{}{}".format("(" if left_open else "[", context.nstr(left.value, digits),
+                                          context.nstr(right.value, digits), ")" if right_open else "]")
+                         for left, right, left_open, right_open in intervals)
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Hand-written parser for the subset of LaTeX produced by MathQuill.
+
+It builds the very same (unevaluated) sympy expressions as sympy.parsing.latex.parse_latex, which is
+much slower as it goes through the ANTLR runtime. Any input outside of the supported subset, or any
+syntax error, raises UnsupportedLaTeX: the caller then falls back to parse_latex, which handles
+the remaining constructs (integrals, limits, derivatives, ...) and reports the syntax errors. """
+
+import re
+
+import sympy
+from sympy.printing.str import StrPrinter
+
+
+class UnsupportedLaTeX(Exception):
+    """Raised when the input is not in the subset handled by this parser"""
+    pass
+
+
+# Commands skipped by the lexer of parse_latex
+skipped_commands = {"thinspace", "medspace", "thickspace", "quad", "qquad", "negthinspace", "negmedspace",
+                    "negthickspace", "left", "right", "vrule", "vcenter", "vbox", "vskip", "vspace", "hfil"}
+skipped_escapes = {",", ":", ";", "!", "*", "-", ".", "/", '"', "(", "="}
+
+# Commands that are tokens of the parse_latex grammar rather than symbols
+operator_commands = {"times": "*", "cdot": "*", "div": "/", "neq": "!=", "leq": "<=", "le": "<=", "leqq": "<=",
+                     "leqslant": "<=", "geq": ">=", "ge": ">=", "geqq": ">=", "geqslant": ">="}
+function_commands = {"exp", "log", "ln", "sin", "cos", "tan", "csc", "sec", "cot", "arcsin", "arccos", "arctan",
+                     "arccsc", "arcsec", "arccot", "sinh", "cosh", "tanh", "arsinh", "arcosh", "artanh"}
+other_commands = {"lfloor", "rfloor", "lceil", "rceil", "sqrt", "overline", "frac", "binom", "dbinom", "tbinom"}
+unsupported_commands = {"lim", "to", "rightarrow", "Rightarrow", "longrightarrow", "Longrightarrow", "int", "sum",
+                        "prod", "mathit", "langle", "rangle", "partial"}
+
+punctuation = set("+-*/()[]{}|^_!=<>:,")
+number_regex = re.compile(r"\d*(?:,\d{3})*\.\d+|\d+(?:,\d{3})*")
+command_regex = re.compile(r"\\([a-zA-Z]+)")
+# A 'd' followed by a letter is lexed as a differential by parse_latex
+differential_regex = re.compile(r"d\s*(?:[a-zA-Z]|\\[a-zA-Z])")
+
+relations = {"=": sympy.Eq, "!=": sympy.Ne, "<": sympy.StrictLessThan, "<=": sympy.LessThan,
+             ">": sympy.StrictGreaterThan, ">=": sympy.GreaterThan}
+trigonometric = {"sin", "cos", "tan", "csc", "sec", "cot", "sinh", "cosh", "tanh"}
+
+
+def tokenize(latex_str):
+    """Splits latex_str in (kind, value) tokens, with kind in "number", "letter", "symbol", "command" and "op" """
+    tokens = []
+    pos = 0
+    length = len(latex_str)
+    while pos < length:
+        char = latex_str[pos]
+        if char in " \t\r\n":
+            pos += 1
+        elif char == "\\":
+            match = command_regex.match(latex_str, pos)
+            if match is None:
+                escaped = latex_str[pos + 1:pos + 2]
+                if escaped in ("{", "}"):
+                    tokens.append(("op", "\\" + escaped))
+                elif escaped not in skipped_escapes:
+                    raise UnsupportedLaTeX(latex_str)
+                pos += 2
+                continue
+            name = match.group(1)
+            pos = match.end()
+            if name in ("left", "right") and latex_str[pos:pos + 1] == "|":
+                raise UnsupportedLaTeX(latex_str)
+            if name in skipped_commands:
+                continue
+            if name in unsupported_commands:
+                raise UnsupportedLaTeX(latex_str)
+            if name in operator_commands:
+                tokens.append(("op", operator_commands[name]))
+            elif name in function_commands or name in other_commands:
+                tokens.append(("command", name))
+            else:
+                tokens.append(("symbol", name))
+        elif char.isdigit() or char == ".":
+            match = number_regex.match(latex_str, pos)
+            if match is None:
+                raise UnsupportedLaTeX(latex_str)
+            tokens.append(("number", match.group(0)))
+            pos = match.end()
+        elif "a" <= char <= "z" or "A" <= char <= "Z":
+            if char == "d" and differential_regex.match(latex_str, pos):
+                raise UnsupportedLaTeX(latex_str)
+            tokens.append(("letter", char))
+            pos += 1
+        elif char in punctuation:
+            tokens.append(("op", char))
+            pos += 1
+        else:
+            raise UnsupportedLaTeX(latex_str)
+    return tokens
+
+
+class Parser(object):
+    """Recursive descent parser following the grammar of parse_latex, rule by rule"""
+
+    def __init__(self, latex_str):
+        self._latex_str = latex_str
+        self._tokens = tokenize(latex_str)
+        self._pos = 0
+        self._abs_depth = 0
+        # Nested or consecutive absolute values are ambiguous, they are left to parse_latex
+        if sum(1 for token in self._tokens if token == ("op", "|")) > 2:
+            self._fail()
+
+    def _fail(self):
+        raise UnsupportedLaTeX(self._latex_str)
+
+    def _peek(self, offset=0):
+        if self._pos + offset < len(self._tokens):
+            return self._tokens[self._pos + offset]
+        return None, None
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            self._fail()
+        self._pos += 1
+        return token
+
+    def _accept(self, value):
+        if self._peek() == ("op", value):
+            self._pos += 1
+            return True
+        return False
+
+    def _expect(self, value):
+        if not self._accept(value):
+            self._fail()
+
+    def parse(self):
+        result = self.relation()
+        if self._pos != len(self._tokens):
+            self._fail()
+        return result
+
+    def relation(self):
+        left = self.expr()
+        while self._peek()[0] == "op" and self._peek()[1] in relations:
+            operator = relations[self._next()[1]]
+            left = operator(left, self.expr())
+        return left
+
+    def expr(self):
+        left = self.mp()
+        while self._peek() in (("op", "+"), ("op", "-")):
+            if self._next()[1] == "+":
+                left = sympy.Add(left, self.mp(), evaluate=False)
+            else:
+                left = sympy.Add(left, sympy.Mul(-1, self.mp(), evaluate=False), evaluate=False)
+        return left
+
+    def mp(self, nofunc=False):
+        left = self.unary(nofunc)
+        while self._peek()[0] == "op" and self._peek()[1] in "*/:":
+            if self._next()[1] == "*":
+                left = sympy.Mul(left, self.unary(nofunc), evaluate=False)
+            else:
+                left = sympy.Mul(left, sympy.Pow(self.unary(nofunc), -1, evaluate=False), evaluate=False)
+        return left
+
+    def unary(self, nofunc=False):
+        if self._accept("+"):
+            return self.unary(nofunc)
+        if self._accept("-"):
+            return -self.unary(nofunc)
+        items = [self.postfix(True)]
+        while self._starts_postfix(not nofunc):
+            items.append(self.postfix(not nofunc))
+        return self.postfix_list(items)
+
+    def _starts_postfix(self, allow_func):
+        kind, value = self._peek()
+        if kind in ("number", "letter", "symbol"):
+            return True
+        if kind == "command":
+            return value in ("frac", "binom", "dbinom", "tbinom", "lfloor", "lceil") or \
+                (allow_func and (value in function_commands or value in ("sqrt", "overline")))
+        if kind == "op":
+            return value in ("(", "[", "{", "\\{") or (value == "|" and self._abs_depth == 0)
+        return False
+
+    def postfix_list(self, items, i=0):
+        result = items[i]
+        if i == len(items) - 1:
+            return result
+        if i > 0 and str(result) == "x" and not items[i - 1].atoms(sympy.Symbol) \
+                and not items[i + 1].atoms(sympy.Symbol):
+            # 2x3 is understood as 2 times 3
+            return self.postfix_list(items, i + 1)
+        return sympy.Mul(result, self.postfix_list(items, i + 1), evaluate=False)
+
+    def postfix(self, allow_func):
+        result = self.exp(allow_func)
+        while True:
+            if self._accept("!"):
+                result = sympy.factorial(result, evaluate=False)
+            elif self._peek() == ("op", "|") and self._peek(1) in (("op", "^"), ("op", "_")):
+                # Evaluation bar
+                self._fail()
+            else:
+                return result
+
+    def exp(self, allow_func):
+        base = self.comp(allow_func)
+        while self._accept("^"):
+            base = sympy.Pow(base, self.atom_or_group(), evaluate=False)
+            if self._peek() == ("op", "_"):
+                self._fail()
+        return base
+
+    def atom_or_group(self):
+        if self._accept("{"):
+            result = self.expr()
+            self._expect("}")
+            return result
+        return self.atom()
+
+    def atom(self):
+        kind, value = self._next()
+        if kind == "number":
+            # Same as sympy.Number(value), without going through the string parser of sympify
+            value = value.replace(",", "")
+            if len(value) > 1 and value[0] == "0" and value[1].isdigit():
+                self._fail()  # Rejected by sympify
+            return sympy.Float(value) if "." in value else sympy.Integer(int(value))
+        if kind == "letter":
+            return sympy.Symbol(value + self.subscript())
+        if kind == "symbol":
+            if value == "infty":
+                self.subscript()
+                return sympy.oo
+            return sympy.Symbol(value + self.subscript())
+        self._fail()
+
+    def subscript(self):
+        if not self._accept("_"):
+            return ""
+        return "_{" + StrPrinter().doprint(self.atom_or_group()) + "}"
+
+    def group(self, closing):
+        result = self.expr()
+        self._expect(closing)
+        return result
+
+    def comp(self, allow_func):
+        kind, value = self._peek()
+        if kind == "op":
+            self._pos += 1
+            if value == "(":
+                return self.group(")")
+            if value == "[":
+                return self.group("]")
+            if value == "{":
+                return self.group("}")
+            if value == "\\{":
+                return self.group("\\}")
+            if value == "|" and self._abs_depth == 0:
+                self._abs_depth += 1
+                result = sympy.Abs(self.expr(), evaluate=False)
+                self._abs_depth -= 1
+                self._expect("|")
+                return result
+            self._fail()
+        if kind in ("letter", "symbol", "number"):
+            result = self.atom()
+            if allow_func and kind != "number" and self._peek() == ("op", "("):
+                if not isinstance(result, sympy.Symbol):
+                    self._fail()
+                return self.function_call(result.name)
+            return result
+        if kind == "command":
+            self._pos += 1
+            if value == "frac":
+                return self.frac()
+            if value in ("binom", "dbinom", "tbinom"):
+                n = self.braced()
+                return sympy.binomial(n, self.braced(), evaluate=False)
+            if value == "lfloor":
+                result = sympy.floor(self.expr(), evaluate=False)
+                self._expect_command("rfloor")
+                return result
+            if value == "lceil":
+                result = sympy.ceiling(self.expr(), evaluate=False)
+                self._expect_command("rceil")
+                return result
+            if allow_func:
+                if value in function_commands:
+                    return self.function(value)
+                if value == "sqrt":
+                    root = self.group("]") if self._accept("[") else None
+                    base = self.braced()
+                    return sympy.root(base, root, evaluate=False) if root is not None \
+                        else sympy.sqrt(base, evaluate=False)
+                if value == "overline":
+                    return sympy.conjugate(self.braced(), evaluate=False)
+        self._fail()
+
+    def _expect_command(self, name):
+        if self._next() != ("command", name):
+            self._fail()
+
+    def braced(self):
+        self._expect("{")
+        return self.group("}")
+
+    def frac(self):
+        top = self.braced()
+        inverse_denominator = sympy.Pow(self.braced(), -1, evaluate=False)
+        if top == 1:
+            return inverse_denominator
+        return sympy.Mul(top, inverse_denominator, evaluate=False)
+
+    def function_call(self, name):
+        # (LETTER | SYMBOL) subexpr? L_PAREN args R_PAREN
+        self._expect("(")
+        args = [self.expr()]
+        while self._accept(","):
+            args.append(self.expr())
+        self._expect(")")
+        return sympy.Function(name)(*args)
+
+    def function(self, name):
+        base = power = None
+        for _ in range(2):
+            if base is None and self._accept("_"):
+                base = self.atom_or_group()
+            elif power is None and self._accept("^"):
+                power = self.atom_or_group()
+        if self._accept("("):
+            arg = self.expr()
+            if self._peek() == ("op", ","):
+                self._fail()
+            self._expect(")")
+        else:
+            arg = self.mp(nofunc=True)
+
+        if name in ("arcsin", "arccos", "arctan", "arccsc", "arcsec", "arccot"):
+            name = "a" + name[3:]
+            expr = getattr(sympy.functions, name)(arg, evaluate=False)
+        elif name in ("arsinh", "arcosh", "artanh"):
+            name = "a" + name[2:]
+            expr = getattr(sympy.functions, name)(arg, evaluate=False)
+        elif name == "exp":
+            expr = sympy.exp(arg, evaluate=False)
+        elif name in ("log", "ln"):
+            if base is None:
+                base = 10 if name == "log" else sympy.E
+            expr = sympy.log(arg, base, evaluate=False)
+
+        should_pow = True
+        if name in trigonometric:
+            if power == -1:
+                name = "a" + name
+                should_pow = False
+            expr = getattr(sympy.functions, name)(arg, evaluate=False)
+        if power and should_pow:
+            expr = sympy.Pow(expr, power, evaluate=False)
+        return expr
+
+
+def parse(latex_str):
+    """Parses latex_str into the same expression as parse_latex, or raises UnsupportedLaTeX"""
+    return Parser(latex_str).parse()
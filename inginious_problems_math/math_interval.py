@@ -1,10 +1,8 @@
 import os
-import sys
 
 from inginious.frontend.task_problems import DisplayableProblem
 from inginious_problems_math.math_problem import MathProblem, DisplayableMathProblem
-
-from sympy import simplify, sympify, N, E, pi, I, Union, Interval, FiniteSet, EmptySet
+from inginious_problems_math import metrics
 
 PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
@@ -12,6 +10,7 @@ math_format = "[0,2]∪[5,∞)"
 problem_type = "math_interval"
 
 
+
 class MathIntervalProblem(MathProblem):
 
     @classmethod
@@ -19,36 +18,39 @@ class MathIntervalProblem(MathProblem):
         return problem_type
 
     @classmethod
-    def parse_answer(cls, latex_str):
+    def normalize_answer(cls, latex_str):
+        return latex_str
+
+    @classmethod
+    def parse_normalized_answer(cls, latex_str):
         """Returns the given input in the form of a Sympy Union object
         it starts by clearing the inputs then converting each subinterval
-        before joining them together based on unions"""
-        wrong_domain_intervals = latex_str.split('\\cup')
-        correct_domain_intervals = []
-        for wrong_format_interval in wrong_domain_intervals:
-            correct_domain_interval = cls.parse_interval(wrong_format_interval)
-            correct_domain_intervals.append(correct_domain_interval)
-        domain = EmptySet
-        for interval in correct_domain_intervals:
-            domain = Union(domain, interval)
-        return domain
+        before joining them together based on unions. Intervals with numeric bounds
+        are merged by normalize, the other ones by sympy"""
+        from sympy import Union, Interval
+        from inginious_problems_math import intervals as normalized_intervals
+        intervals = [cls.parse_interval(latex_interval) for latex_interval in latex_str.split('\\cup')]
+        normalized = normalized_intervals.normalize(intervals)
+        if normalized is None:
+            return Union(*[Interval(*interval) for interval in intervals])
+        return normalized_intervals.to_sympy(normalized)
 
     @classmethod
     def parse_interval(cls, latex_interval):
-        """parse a single interval such as, for example (a,b] 
-        into a Sympy Interval object"""
+        """parse a single interval such as, for example (a,b]
+        into a (left, right, left_open, right_open) tuple"""
         borders, left_open, right_open = cls.sanitize_interval_input(latex_interval)
         borders = borders.split(',')
         if len(borders) == 1 and left_open == right_open and not left_open: #Consider single element interval such as [5]
             unique_element = cls.parse_element(borders[0])
-            return Interval(unique_element, unique_element)
+            return unique_element, unique_element, False, False
         if len(borders) != 2:
             raise ValueError("Correct intervals should contain 2 borders")
         left_element = borders[0]
         right_element = borders[1]
         leftBorder = cls.parse_element(left_element)
         rightBorder = cls.parse_element(right_element)
-        return Interval(leftBorder, rightBorder, left_open, right_open)
+        return leftBorder, rightBorder, left_open, right_open
 
     @classmethod
     def sanitize_interval_input(cls, latex_input):
@@ -70,20 +72,59 @@ class MathIntervalProblem(MathProblem):
     def parse_element(cls, element):
         """Parse a single element and returns it as a Sympy expression
         Called on every intervals borders"""
-        element = element.replace("∞", str(sys.maxsize))
-        element = element.replace("\\infty", str(sys.maxsize))
-        element = element.replace("\\infinity", str(sys.maxsize))
-        return MathProblem.parse_answer(element)
-
-    def is_equal(self, eq1, eq2):
-        """Redfines the is_equal to only accept Intervals and Unions"""
+        element = element.replace("∞", "\\infty")
+        element = element.replace("\\infinity", "\\infty")
+        # The parser keeps the operations unevaluated
+        return MathProblem.parse_answer(element).doit()
+
+    def evaluate_numerically(self, eq):
+        """Returns the normalized intervals of eq (see intervals.normalize), or None if a bound is not a real number"""
+        from inginious_problems_math import intervals
+        return intervals.normalize(intervals.decompose(eq))
+
+    def compare_entries(self, entry1, entry2):
+        """Intervals with numeric bounds are compared bound by bound, the other ones once simplified"""
+        intervals1, intervals2 = entry1["values"], entry2["values"]
+        if intervals1 is None or intervals2 is None:
+            return MathProblem.compare_entries(self, entry1, entry2)
+        with metrics.timer("compare"):
+            if len(intervals1) != len(intervals2):
+                return False
+            return all(self.same_bound(interval1[i], interval2[i]) for interval1, interval2 in zip(intervals1, intervals2)
+                       for i in range(2)) and \
+                all(interval1[2:4] == interval2[2:4] for interval1, interval2 in zip(intervals1, intervals2))
+
+    def same_bound(self, bound1, bound2):
+        if self._tolerance and bound1.is_finite() and bound2.is_finite():
+            return round(float(abs(bound1.value - bound2.value)), 10) <= round(float(self._tolerance), 10)
+        return bound1.value == bound2.value
+
+    def get_fingerprint(self, eq):
+        """Intervals with numeric bounds are fingerprinted by their rounded bounds and their openness"""
+        if self._tolerance:
+            return None
+        from inginious_problems_math import fingerprint, intervals
+        normalized = intervals.normalize(intervals.decompose(eq))
+        if normalized is None:
+            return None
+        return fingerprint.Fingerprint(intervals.get_key(normalized, fingerprint.key_digits), None)
+
+    def canonicalize(self, eq):
+        from sympy import simplify
+        with metrics.timer("simplify"):
+            return simplify(eq)
+
+    def compare_canonical(self, eq1, eq2):
+        """Redefines the comparison to only accept Intervals and Unions"""
+        from sympy import Union, Interval, FiniteSet, EmptySet
         #Intervals
         if type(eq1) in [Interval, Union, FiniteSet, EmptySet] and type(eq2) in [Interval, Union, FiniteSet, EmptySet]:
-            return eq1 == eq2 or simplify(eq1) == simplify(eq2)
+            return eq1 == eq2
         elif eq1 == EmptySet and eq2 == EmptySet:
             return True
         return False
 
+
 class DisplayableMathIntervalProblem(MathIntervalProblem, DisplayableProblem):
     """ A displayable math problem """
 
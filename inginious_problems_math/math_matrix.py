@@ -2,9 +2,7 @@ import os
 
 from inginious.frontend.task_problems import DisplayableProblem
 from inginious_problems_math.math_problem import MathProblem, DisplayableMathProblem
-
-from sympy import Matrix
-from sympy import simplify
+from inginious_problems_math import metrics
 
 PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
@@ -19,12 +17,18 @@ class MathMatrixProblem(MathProblem):
         return problem_type
 
     @classmethod
-    def parse_answer(cls, latex_str):
-        """Redefines the parse_answer to parse each element of each line"""
+    def normalize_answer(cls, latex_str):
         latex_str = latex_str.replace('\\left[', '')
         latex_str = latex_str.replace('\\right]', '')
+        return latex_str
+
+    @classmethod
+    def parse_normalized_answer(cls, latex_str):
+        """Redefines the parser to parse each element of each line.
+        The matrix is immutable as parsed answers are shared through the parse cache"""
+        from sympy import ImmutableMatrix
         latex_str_tab = latex_str.split(':')
-        return Matrix(list(map(cls.parse_line,latex_str_tab)))
+        return ImmutableMatrix(list(map(cls.parse_line,latex_str_tab)))
 
     @classmethod
     def parse_line(cls,latex_str):
@@ -34,12 +38,54 @@ class MathMatrixProblem(MathProblem):
 
     @classmethod
     def parse_element(cls, latex_str):
-        """Parse a single element"""
-        # Needs simplify because the parser of MathProblem doesn't do any
-        return simplify(MathProblem.parse_answer(latex_str))
-
-    def is_equal(self, matrix1, matrix2):
-        """Refefines the is_equal method to compare two matrix by comparing lines one by one"""
+        """Parse a single element. Integers, decimals and fractions of integers are built directly, the other
+        elements are parsed and evaluated, but only simplified when the matrix does not structurally match
+        (see canonicalize)"""
+        number = MathProblem.parse_number(latex_str)
+        if number is not None:
+            return number
+        # The parser keeps the operations unevaluated
+        return MathProblem.parse_answer(latex_str).doit()
+
+    def evaluate_numerically(self, matrix):
+        """Returns the values of a matrix whose elements are all integers, decimals or rationals as a NumPy
+        array, or None. They are only compared with the tolerance: without it, the exact elements are compared"""
+        if not self._tolerance or not all(element.is_Rational or element.is_Float for element in matrix):
+            return None
+        import numpy
+        try:
+            return numpy.array(matrix.tolist(), dtype=float)
+        except (OverflowError, TypeError):
+            return None
+
+    def compare_entries(self, entry1, entry2):
+        """Numeric matrices are compared with NumPy when the problem has a tolerance. The other ones are compared
+        structurally, then element by element once simplified"""
+        matrix1, matrix2 = entry1["answer"], entry2["answer"]
+        if matrix1.shape != matrix2.shape:
+            return False
+        if entry1["values"] is not None and entry2["values"] is not None:
+            import numpy
+            with metrics.timer("numeric"):
+                differences = numpy.round(numpy.abs(entry1["values"] - entry2["values"]), 10)
+                return bool(numpy.all(differences <= round(self._tolerance, 10)))
+        if matrix1 == matrix2:
+            return True
+        if all(element.is_Number for element in matrix1) and all(element.is_Number for element in matrix2):
+            # Numbers are left as is by canonicalize
+            return False
+        canonical1, canonical2 = self.get_canonical(entry1), self.get_canonical(entry2)
+        with metrics.timer("compare"):
+            return self.compare_canonical(canonical1, canonical2)
+
+    def canonicalize(self, matrix):
+        """Simplifies the elements, except the numbers"""
+        from sympy import simplify
+        with metrics.timer("simplify"):
+            return matrix.applyfunc(lambda element: element if element.is_Number else simplify(element))
+
+    def compare_canonical(self, matrix1, matrix2):
+        """Redefines the comparison to compare two matrix by comparing lines one by one"""
         return matrix1 == matrix2
 
     def check_len(self, student_answer, correct_answer):
@@ -56,14 +102,36 @@ class MathMatrixProblem(MathProblem):
 
     def sort(self, answers):
         """Redefines the sorting method to sort matrix in case of multiple matrix asked"""
-        return sorted(answers, key=lambda x: self.compare(x))
-
-    def compare(self, answer):
-        """Compare matrix based on their int representations for ordering. This is only useful if multiple answers (matrix) are asked"""
-        int_representation = [ord(c) for c in str(answer)]
-        s = [str(i) for i in int_representation]
-        res = int("".join(s))
-        return float(str(len(answer)) + "." + str(res))
+        return sorted(answers, key=self.get_sort_key)
+
+    def get_sort_key(self, answer):
+        """Orders matrices by shape, then by the values of their numeric elements and the fingerprints of the
+        other ones, so that equal matrices share their key. Elements without fingerprint use their structure"""
+        from inginious_problems_math import fingerprint
+        keys = []
+        for element in answer:
+            if element.is_number:
+                value = complex(element)
+                keys.append((0, round(value.real, 9), round(value.imag, 9)))
+                continue
+            element_fingerprint = fingerprint.get_fingerprint(element)
+            keys.append((1, element_fingerprint.key) if element_fingerprint else (2, str(element)))
+        return answer.shape, tuple(keys)
+
+    def get_fingerprint(self, matrix):
+        """Combines the fingerprints of the elements, a matrix has none if one of its elements has none"""
+        if self._tolerance:
+            return None
+        from inginious_problems_math import fingerprint
+        with metrics.timer("fingerprint"):
+            fingerprints = [fingerprint.get_fingerprint(element) for element in matrix]
+        if any(element is None for element in fingerprints):
+            return None
+        residues = None
+        if all(element.residues is not None for element in fingerprints):
+            residues = tuple(value for element in fingerprints for value in element.residues)
+        return fingerprint.Fingerprint("{}x{}|".format(*matrix.shape) + "|".join(element.key for element in fingerprints),
+                                       residues)
 
 
 class DisplayableMathMatrixProblem(MathMatrixProblem, DisplayableProblem):
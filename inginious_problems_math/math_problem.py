@@ -2,24 +2,59 @@ import os
 import re
 import json
 import math
+import hashlib
 
-from sympy.core import Number
-from sympy.parsing.latex import parse_latex
-from sympy.printing.latex import latex
-from sympy import simplify, sympify, expand_log, expand_trig, factor, N, E, pi, I, Equality, Unequality, StrictLessThan, LessThan, StrictGreaterThan, GreaterThan
 from inginious.common.tasks_problems import Problem
 from inginious.frontend.task_problems import DisplayableProblem
 from inginious.frontend.parsable_text import ParsableText
+from inginious_problems_math.cache import LRUCache, SizedLRUCache
+from inginious_problems_math import metrics
+
+# sympy, numpy and the modules relying on them take seconds to import: they are only imported by the
+# methods parsing or comparing answers, so that registering and displaying the problems does not need them
 
 PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
 math_format = "expression: 5x+3  equation: x=y+3  inequation: x<2y+1"
 problem_type = "math"
 
+# Compiled answer keys, shared by every problem instance with the same grading-relevant content
+answer_keys = LRUCache(maxsize=512)
+# Parsed answers, shared by every problem type and keyed on (problem type, normalized LaTeX input)
+parse_cache = LRUCache(maxsize=4096)
+# Rendered inputs of the problems, keyed on a hash of the content they are rendered from: editing the task
+# changes it. Bounded by their number and total size
+rendered_inputs = SizedLRUCache(maxsize=1024, maxbytes=16 * 2 ** 20)
+# Numeric answers, built without the LaTeX parser
+number_pattern = re.compile(r"^\s*(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?)\s*$")
+fraction_pattern = re.compile(r"^\s*(-?)\\frac\{\s*(-?(?:0|[1-9][0-9]*))\s*\}\{\s*([1-9][0-9]*)\s*\}\s*$")
+
+
+def configure(config):
+    """Applies the entries of the plugin configuration the grading depends on: the sizes of the caches and the
+    options of the numerical check. Called by the plugin, and by each worker of the grading pool"""
+    parse_cache.resize(config.get("parse_cache_size", 4096))
+    answer_keys.resize(config.get("answer_key_cache_size", 512))
+    for option in ["numeric_samples", "numeric_rtol", "numeric_atol", "numeric_reject_ratio"]:
+        if option in config:
+            setattr(MathProblem, option, config[option])
+
 
 class MathProblem(Problem):
     """Display an input box and check that the content is correct"""
 
+    # Randomized numerical pre-check of is_equal: number of sample points (0 disables it), tolerances
+    # and ratio of disagreeing points above which an answer is rejected without simplification.
+    # Raising the ratio or the tolerances lowers the risk of rejecting a correct answer
+    numeric_samples = 12
+    numeric_rtol = 1e-6
+    numeric_atol = 1e-9
+    numeric_reject_ratio = 0.5
+    # GradingPool running grade in worker processes with a deadline, set by the plugin configuration
+    grading_pool = None
+    # VerdictStore shared by the processes of the node, set by the plugin configuration
+    verdict_store = None
+
     def __init__(self, problemid, content, translations, taskfs):
         Problem.__init__(self, problemid, content, translations, taskfs)
         self._header = content['header'] if "header" in content else ""
@@ -51,50 +86,228 @@ class MathProblem(Problem):
         except:
             state = ""
 
+        from inginious_problems_math.state import keep_state
         if not isinstance(self._answers, list):
-            return None, None, None, 0, state
+            return None, None, None, 0, keep_state(state)
+
+        with metrics.timer("check_answer"):
+            verdict, detail, new_state = self.get_outcome(task_input[self.get_id()])
+        metrics.count("verdict", verdict)
+        return self.get_feedback(verdict, detail, language) + (0, new_state if new_state is not None else keep_state(state))
+
+    def get_outcome(self, student_inputs):
+        """Returns the outcome of grade for the student inputs, from the verdict store if possible"""
+        outcome = None
+        if self.verdict_store is not None:
+            answer_key_hash = self.get_answer_key_hash()
+            normalized_inputs = [self.normalize_answer(eq) for eq in student_inputs]
+            outcome = self.verdict_store.get(answer_key_hash, normalized_inputs)
+
+        if outcome is None:
+            if self.grading_pool is not None:
+                outcome = self.grading_pool.grade(self, student_inputs)
+            else:
+                outcome = self.grade(student_inputs)
+            # Timeouts depend on the load of the workers, and errors (such as MemoryError) may be transient:
+            # they are not stored
+            if self.verdict_store is not None and outcome[0] not in ["timeout", "error"]:
+                self.verdict_store.put(answer_key_hash, normalized_inputs, outcome)
+        return outcome
+
+    def grade(self, student_inputs):
+        """Grades the LaTeX inputs of a student. Returns a (verdict, detail, state) tuple where verdict is one of
+        "parsing_error", "count", "choice", "wrong", "error" or "correct", detail the choice index, error or
+        answer to report, and state the new problem state (see state, None to keep the previous one).
+        This does not depend on the language of the student and can thus be run in a separate process"""
+        from sympy.printing.latex import latex
         try:
-            student_answers = [self.parse_answer(eq) for eq in task_input[self.get_id()]]
-            correct_answers = [self.parse_answer(eq) for eq in self._answers]
-            unexpec_answers = [self.parse_answer(choice["answer"]) for choice in self._choices]
+            student_answers = [self.parse_answer(eq) for eq in student_inputs]
+            answer_key = self.get_answer_key()
         except Exception as e:
-            return False, None, ["_wrong_answer", "Parsing error: \n\n .. code-block:: \n\n\t" + str(e).replace("\n", "\n\t")], 0, state
+            return "parsing_error", str(e), None
 
-        # Sort both student and correct answers array per their string representation
-        # Equal equations should have the same string representation
-        student_answers = self.sort(student_answers)
-        correct_answers = self.sort(correct_answers)
+        # Sort the student answers per their string representation, as the correct ones are, which keeps
+        # the state stable. The matching does not depend on their order but tries the same position first
+        with metrics.timer("sort"):
+            student_answers = self.sort(student_answers)
+        correct_answers = [entry["answer"] for entry in answer_key["answers"]]
 
         # Check for correct amount of answers
         checker = self.check_len(student_answers, correct_answers)
         if not checker[0]:
-            return False, None, [checker[1]], 0, state
-
-        state = json.dumps([latex(answer) for answer in student_answers])
-
-        # Check if an unexpected answer has been given
-        for i in range(0, len(self._choices)):
-            unexpec_answer = unexpec_answers[i]
-            for student_answer in student_answers:
-                try:
-                    if self.is_equal(student_answer, unexpec_answer):
-                        msg = self.gettext(language, self._choices[i]["feedback"])
-                        return False, None, [msg], 0, state
-                except Exception as e:
-                    return False, None, [str(e)], 0, state
-
-        for i in range(0, len(correct_answers)):
-            try:
-                if not self.is_equal(student_answers[i], correct_answers[i]):
-                    msg = [self.gettext(language, self._error_message) or "_wrong_answer"]
-                    msg += ["Not correct : :math:`{}`".format(latex(student_answers[i]))]
-                    return False, None, msg, 0, state
-            except Exception as e:
-                return False, None, [str(e)], 0, state
+            return "count", checker[1], None
 
+        student_entries = [self.make_entry(answer) for answer in student_answers]
+        with metrics.timer("state"):
+            state = self.get_state(student_inputs, student_entries)
 
-        msg = self.gettext(language, self._success_message) or "_correct_answer"
-        return True, None, [msg], 0, state
+        # Correct answers are recognized first, the choices are only looked up for the other ones
+        try:
+            unmatched = self.match_entries(student_entries, answer_key["answers"])
+            if not unmatched:
+                return "correct", None, state
+            choice = self.find_choice(student_entries, answer_key)
+        except Exception as e:
+            return "error", str(e), state
+        if choice is not None:
+            return "choice", choice, state
+        return "wrong", latex(student_answers[unmatched[0]]), state
+
+    def get_state(self, student_inputs, student_entries):
+        """Returns the problem state of the inputs of a student, given the entries of their answers"""
+        from inginious_problems_math import state
+        try:
+            fingerprints = [self.get_entry_fingerprint(entry) for entry in student_entries]
+        except Exception:
+            fingerprints = None
+        return state.make_state([self.normalize_answer(eq) for eq in student_inputs], fingerprints)
+
+    def get_feedback(self, verdict, detail, language):
+        """Returns the validity, main message and problem messages matching a verdict returned by grade"""
+        if verdict == "parsing_error":
+            return False, None, ["_wrong_answer", "Parsing error: \n\n .. code-block:: \n\n\t" + detail.replace("\n", "\n\t")]
+        elif verdict == "choice":
+            return False, None, [self.gettext(language, self._choices[detail]["feedback"])]
+        elif verdict == "wrong":
+            msg = [self.gettext(language, self._error_message) or "_wrong_answer"]
+            msg += ["Not correct : :math:`{}`".format(detail)]
+            return False, None, msg
+        elif verdict == "timeout":
+            return False, None, ["_wrong_answer", "Answer too complex to verify"]
+        elif verdict == "correct":
+            msg = self.gettext(language, self._success_message) or "_correct_answer"
+            return True, None, [msg]
+        # count and error verdicts carry their own message
+        return False, None, [detail]
+
+    def get_answer_key_signature(self):
+        """Returns the grading-relevant content of the problem. Two problems with the same signature
+        share the same compiled answer key"""
+        return (self.get_type(), tuple(self._answers), tuple(choice["answer"] for choice in self._choices),
+                self._tolerance, self._comparison_type, self._use_log, self._use_trigo, self._use_complex,
+                self.numeric_samples, self.numeric_rtol, self.numeric_atol, self.numeric_reject_ratio)
+
+    def get_comparison_signature(self):
+        """Returns the settings of the problem that the comparison of two answers depends on"""
+        return (self.get_type(), self._tolerance, self._comparison_type, self._use_log, self._use_trigo,
+                self._use_complex, self.numeric_samples, self.numeric_rtol, self.numeric_atol,
+                self.numeric_reject_ratio)
+
+    def get_answer_key_hash(self):
+        """Returns a hash of the grading-relevant content of the problem"""
+        return hashlib.sha256(json.dumps(self.get_answer_key_signature()).encode("utf-8")).hexdigest()
+
+    def get_answer_key(self):
+        """Returns the compiled answer key of the problem, compiling it on first use"""
+        signature = self.get_answer_key_signature()
+        answer_key = answer_keys.get(signature)
+        if answer_key is None:
+            answer_key = self.compile_answer_key()
+            answer_keys.put(signature, answer_key)
+        return answer_key
+
+    def compile_answer_key(self):
+        """Parses the correct answers and the choices once, along with their canonical forms and fingerprints,
+        and indexes the choices by fingerprint"""
+        from inginious_problems_math.fingerprint import FingerprintIndex
+        correct_answers = self.sort([self.parse_answer(eq) for eq in self._answers])
+        unexpec_answers = [self.parse_answer(choice["answer"]) for choice in self._choices]
+        answer_key = {
+            "answers": [self.make_entry(answer) for answer in correct_answers],
+            "choices": [self.make_entry(answer) for answer in unexpec_answers]
+        }
+        for entry in answer_key["answers"] + answer_key["choices"]:
+            self.get_canonical(entry)
+            self.get_entry_fingerprint(entry)
+        answer_key["choice_index"] = FingerprintIndex()
+        for i, entry in enumerate(answer_key["choices"]):
+            answer_key["choice_index"].add(entry["fingerprint"], i)
+        return answer_key
+
+    def make_entry(self, eq):
+        """Wraps a parsed answer with its numerical evaluation. Its canonical form is added on first use"""
+        return {"answer": eq, "values": self.evaluate_numerically(eq)}
+
+    def get_canonical(self, entry):
+        if "canonical" not in entry:
+            entry["canonical"] = self.canonicalize(entry["answer"])
+        return entry["canonical"]
+
+    def get_entry_fingerprint(self, entry):
+        if "fingerprint" not in entry:
+            entry["fingerprint"] = self.get_fingerprint(entry["answer"])
+        return entry["fingerprint"]
+
+    def evaluate_numerically(self, eq):
+        """Returns the values of eq at random sample points, or None if the numerical pre-check
+        does not apply to this answer"""
+        if self._comparison_type == "perfect_match" or self._tolerance:
+            return None
+        from inginious_problems_math import numeric
+        with metrics.timer("numeric"):
+            return numeric.evaluate(eq, self.numeric_samples, self._use_complex)
+
+    def get_fingerprint(self, eq):
+        """Returns the fingerprint of a parsed answer, shared by the answers it may be equal to (see fingerprint),
+        or None if it does not tell them apart"""
+        if self._tolerance:
+            return None
+        from inginious_problems_math import fingerprint
+        with metrics.timer("fingerprint"):
+            return fingerprint.get_fingerprint(eq)
+
+    def compare_entries(self, entry1, entry2):
+        """Compare answers wrapped by make_entry. Answers that clearly differ numerically are
+        rejected before computing their canonical form"""
+        from inginious_problems_math import numeric
+        with metrics.timer("numeric"):
+            differ = numeric.differ(entry1["values"], entry2["values"], self.numeric_rtol, self.numeric_atol,
+                                    self.numeric_reject_ratio)
+        if differ:
+            return False
+        canonical1, canonical2 = self.get_canonical(entry1), self.get_canonical(entry2)
+        with metrics.timer("compare"):
+            return self.compare_canonical(canonical1, canonical2)
+
+    def match_entries(self, student_entries, correct_entries):
+        """Pairs each student answer with a distinct correct answer equal to it, whatever their order, as a
+        maximum bipartite matching. Only the answers sharing a fingerprint are compared, each pair at most once,
+        the answer at the same position first. Returns the indices of the student answers left unmatched"""
+        from inginious_problems_math.fingerprint import FingerprintIndex
+        index = FingerprintIndex()
+        for j, entry in enumerate(correct_entries):
+            index.add(self.get_entry_fingerprint(entry), j)
+        candidates = [sorted(index.candidates(self.get_entry_fingerprint(entry)), key=lambda j, i=i: j != i)
+                      for i, entry in enumerate(student_entries)]
+        verdicts = {}
+        matches = {}
+
+        def augment(i, visited):
+            for j in candidates[i]:
+                if j in visited:
+                    continue
+                if (i, j) not in verdicts:
+                    verdicts[(i, j)] = self.compare_entries(student_entries[i], correct_entries[j])
+                if not verdicts[(i, j)]:
+                    continue
+                visited.add(j)
+                if j not in matches or augment(matches[j], visited):
+                    matches[j] = i
+                    return True
+            return False
+
+        with metrics.timer("match"):
+            return [i for i in range(len(student_entries)) if not augment(i, set())]
+
+    def find_choice(self, student_entries, answer_key):
+        """Returns the index of the first choice equal to a student answer, or None. Only the choices whose
+        fingerprint may be equal to the one of a student answer are compared"""
+        pairs = sorted((j, i) for i, entry in enumerate(student_entries)
+                       for j in answer_key["choice_index"].candidates(self.get_entry_fingerprint(entry)))
+        for j, i in pairs:
+            if self.compare_entries(student_entries[i], answer_key["choices"][j]):
+                return j
+        return None
 
     def check_len(self, student_anwer, correct_answer):
         """ Verify the number of answers"""
@@ -108,7 +321,33 @@ class MathProblem(Problem):
 
     @classmethod
     def parse_answer(cls, latex_str):
+        """Returns the answer parsed from its LaTeX input. Parsed answers are memoized per problem type"""
+        with metrics.timer("normalize"):
+            latex_str = cls.normalize_answer(latex_str)
+        key = (cls.get_type(), latex_str)
+        eq = parse_cache.get(key)
+        if eq is None:
+            eq = cls.parse_normalized_answer(latex_str)
+            parse_cache.put(key, eq)
+        return eq
+
+    @classmethod
+    def parse_number(cls, latex_str):
+        """Returns the integer, decimal or fraction of integers written by latex_str, or None if it is not one"""
+        from sympy import Float, Integer, Rational
+        match = number_pattern.match(latex_str)
+        if match:
+            value = match.group(1)
+            return Float(value) if "." in value else Integer(int(value))
+        match = fraction_pattern.match(latex_str)
+        if match:
+            sign = -1 if match.group(1) else 1
+            return Rational(sign * int(match.group(2)), int(match.group(3)))
+        return None
 
+    @classmethod
+    def normalize_answer(cls, latex_str):
+        """Rewrites the LaTeX input in the subset supported by the parser"""
         # The \left and \right prefix are not supported by sympy (and useless for treatment)
         latex_str = re.sub("(\\\left|\\\right)", "", latex_str)
         latex_str = re.sub("(\\\log_)(\w)(\(|\^)", "\\\log_{\\2}\\3", latex_str)
@@ -117,36 +356,62 @@ class MathProblem(Problem):
         latex_str = latex_str.replace("\\ne", "\\neq")
         latex_str = latex_str.replace("\\right|", "|")
         latex_str = latex_str.replace("\\left|", "|")
+        return latex_str
 
+    @classmethod
+    def parse_normalized_answer(cls, latex_str):
+        """Parses a LaTeX input returned by normalize_answer"""
+        from sympy import sympify, E, pi, I
+        from sympy.parsing.latex import parse_latex
+        from inginious_problems_math import latex_parser
         #general constants: always use i for imaginary constant, e for natural logarithm basis and \pi (or the symbol from toolbox) for pi
-        eq = sympify(parse_latex(latex_str).subs([("e", E), ("i", I), ("pi", pi)]))
+        with metrics.timer("parse_latex"):
+            try:
+                eq = latex_parser.parse(latex_str)
+            except latex_parser.UnsupportedLaTeX:
+                # Integrals, derivatives, ... and syntax errors are left to the ANTLR based parser
+                eq = parse_latex(latex_str)
+        with metrics.timer("sympify"):
+            eq = sympify(eq.subs([("e", E), ("i", I), ("pi", pi)]))
         # Do not simplify the answer to be able to check for perfect match if needed
         return eq
 
     def is_equal(self, eq1, eq2):
         """Compare answers"""
         #answer=eq1, solution=eq2
-        equation_types = [Equality, Unequality, StrictLessThan, LessThan, StrictGreaterThan, GreaterThan]
+        with metrics.timer("is_equal"):
+            return self.compare_entries(self.make_entry(eq1), self.make_entry(eq2))
+
+    def canonicalize(self, eq):
+        """Returns the form of an answer on which the comparison is made"""
+        from sympy import simplify, expand_log, expand_trig, factor, E, pi
         #Symbolic equality/Perfect match
         if self._comparison_type == "perfect_match":
-            return eq1 == eq2
-        eq1 = factor(simplify(eq1))    #simplify is mandatory to counter expand_trig and expand_log weaknesses
-        eq2 = factor(simplify(eq2))
+            return eq
+        with metrics.timer("simplify"):
+            eq = factor(simplify(eq))    #simplify is mandatory to counter expand_trig and expand_log weaknesses
         #Trigonometric simplifications
         if self._use_trigo:
-            eq1 = expand_trig(eq1)
-            eq2 = expand_trig(eq2)
+            with metrics.timer("expand_trig"):
+                eq = expand_trig(eq)
         #Logarithmic simplifications
         if self._use_log:
-            if self._use_complex:
-                eq1 = expand_log(eq1)
-                eq2 = expand_log(eq2)
-            else:
-                eq1 = expand_log(eq1, force=True)
-                eq2 = expand_log(eq2, force=True)
+            with metrics.timer("expand_log"):
+                if self._use_complex:
+                    eq = expand_log(eq)
+                else:
+                    eq = expand_log(eq, force=True)
         if self._tolerance:
-            eq1 = eq1.subs([(E, math.e), (pi, math.pi)])
-            eq2 = eq2.subs([(E, math.e), (pi, math.pi)])
+            eq = eq.subs([(E, math.e), (pi, math.pi)])
+        return eq
+
+    def compare_canonical(self, eq1, eq2):
+        """Compare answers already put in their canonical form"""
+        from sympy import simplify, N, Number, Equality, Unequality, StrictLessThan, LessThan, StrictGreaterThan, GreaterThan
+        equation_types = [Equality, Unequality, StrictLessThan, LessThan, StrictGreaterThan, GreaterThan]
+        #Symbolic equality/Perfect match
+        if self._comparison_type == "perfect_match":
+            return eq1 == eq2
         #Numbers
         if (isinstance(eq1, Number) and isinstance(eq2, Number)) or self._tolerance:
             return round(float(abs(N(eq1 - eq2))), 10) <= round(float(self._tolerance), 10) if self._tolerance else abs(N(eq1 - eq2)) == 0
@@ -205,11 +470,20 @@ class DisplayableMathProblem(MathProblem, DisplayableProblem):
         return problem_type
 
     def show_input(self, template_helper, language, seed, format=math_format):
-        """ Show MathProblem """
-        header = ParsableText(self.gettext(language, self._header), "rst",
-                              translation=self.get_translation_obj(language))
-        return template_helper.render("math.html", template_folder=PATH_TO_TEMPLATES, inputId=self.get_id(),
-                                      header=header, hints=self._hints, format=format)
+        """ Show MathProblem. The rendering of the problem only depends on the translated header, the hints and
+        the format, and is cached. The script starting it depends on the URL of the request, and is not """
+        header = self.gettext(language, self._header)
+        key = hashlib.sha256(json.dumps([self.get_type(), self.get_id(), language, header, self._hints, format],
+                                        sort_keys=True).encode("utf-8")).hexdigest()
+        rendered = rendered_inputs.get(key)
+        if rendered is None:
+            header = ParsableText(header, "rst", translation=self.get_translation_obj(language))
+            rendered = template_helper.render("math.html", template_folder=PATH_TO_TEMPLATES, inputId=self.get_id(),
+                                              problemType=self.get_type(), header=header, hints=self._hints,
+                                              format=format)
+            rendered_inputs.put(key, rendered)
+        return rendered + template_helper.render("math_script.html", template_folder=PATH_TO_TEMPLATES,
+                                                 inputId=self.get_id())
 
     @classmethod
     def show_editbox(cls, template_helper, key, language):
@@ -3,8 +3,7 @@ import re
 
 from inginious.frontend.task_problems import DisplayableProblem
 from inginious_problems_math.math_problem import MathProblem, DisplayableMathProblem
-
-from sympy import simplify, sympify, N, E, pi, I, Union, Intersection, FiniteSet, EmptySet, ConditionSet, S
+from inginious_problems_math import metrics
 
 PATH_TO_PLUGIN = os.path.abspath(os.path.dirname(__file__))
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
@@ -18,15 +17,24 @@ class MathSetProblem(MathProblem):
         """Adds the set_type to the generic ProblemMath constructor"""
         super().__init__(problemid, content, translations, taskfs)
         self._set_type = content.get("set_type", None)
+        # Sets are first compared on the integers (and a grid of reals) between -set_window and set_window, plus
+        # points around the numbers of their conditions. When this cannot tell, set_fallback tells if solveset
+        # is tried before the comparison of the simplified sets
+        self._set_window = int(content.get("set_window", 100))
+        self._set_fallback = content.get("set_fallback", "solveset")
 
     @classmethod
     def get_type(cls):
         return problem_type
 
     @classmethod
-    def parse_answer(cls, latex_str):
+    def normalize_answer(cls, latex_str):
         eq = latex_str.replace("\\left\\{", "{")
         eq = eq.replace("\\right\\}", "}")
+        return eq
+
+    @classmethod
+    def parse_normalized_answer(cls, eq):
         if "|" in eq:
             return cls.parse_implicit_set(eq)
         else:
@@ -35,31 +43,36 @@ class MathSetProblem(MathProblem):
     @classmethod
     def parse_explicit_set(cls, eq):
         """Parses potentially multiple explicit sets with unions and intersections,
-         eq is formatted such as {1,2,3}u{4,5,6}"""
-        final_set_1 = S.UniversalSet
-        tab_1 = eq.split('\\cap')  # Intersections
-        for set_1 in tab_1:
-            tab_2 = set_1.split('\\cup')  # Unions
-            final_set_2 = EmptySet
-            for set_2 in tab_2:
-                sympy_set_2 = cls.parse_single_explicit_set(set_2)
-                final_set_2 = Union(final_set_2, sympy_set_2)
-            final_set_1 = Intersection(final_set_1, final_set_2)
-        return simplify(final_set_1)
+         eq is formatted such as {1,2,3}u{4,5,6}. Sets of numbers are evaluated by sympy as a single FiniteSet,
+         the other ones are simplified"""
+        from sympy import simplify, Union, Intersection, FiniteSet, S
+        groups = [Union(*[cls.parse_single_explicit_set(set_2) for set_2 in set_1.split('\\cup')])  # Unions
+                  for set_1 in eq.split('\\cap')]  # Intersections
+        final_set = Intersection(*groups)
+        if isinstance(final_set, FiniteSet) or final_set is S.EmptySet:
+            return final_set
+        return simplify(final_set)
 
     @classmethod
     def parse_single_explicit_set(cls, eq):
         """Parses a single explicit set, formatted such as {1,2,3}"""
-        eq = eq[1:-1]
-        eq_tab = eq.split(',')
-        expressions_tab = list(map(MathProblem.parse_answer, eq_tab))
-        final_set = sympify({element for element in expressions_tab})
-        return final_set
+        from sympy import FiniteSet
+        return FiniteSet(*[cls.parse_element(element) for element in eq[1:-1].split(',')])
+
+    @classmethod
+    def parse_element(cls, latex_str):
+        """Parses an element of an explicit set. Integers, decimals and fractions of integers are built directly"""
+        number = MathProblem.parse_number(latex_str)
+        if number is not None:
+            return number
+        # The parser keeps the operations unevaluated
+        return MathProblem.parse_answer(latex_str).doit()
 
     @classmethod
     def parse_implicit_set(cls, eq):
         """Parses an implicit set, formatted such as {variable, condition, domain}
         For example, eq could be {x|(x²>25)&(x³<150)}"""
+        from sympy import ConditionSet
         eq = eq[1:-1]
         eq = eq.replace("\\left", "")
         eq = eq.replace("\\right", "")
@@ -69,10 +82,11 @@ class MathSetProblem(MathProblem):
         target = MathProblem.parse_answer(eq_tab[0])
         condition = cls.parse_conditions(eq_tab[1])
         domain = cls.parse_domain(eq_tab[2])
-        return simplify(ConditionSet(target, condition, domain))
+        return ConditionSet(target, condition, domain)
 
     @classmethod
     def parse_domain(cls, domain):
+        from sympy import sympify
         domain = domain.replace("N", "S.Naturals")
         domain = domain.replace("Z+", "S.Naturals0")
         domain = domain.replace("Z-", "S.Integers-S.Naturals")
@@ -83,6 +97,8 @@ class MathSetProblem(MathProblem):
 
     @classmethod
     def parse_conditions(cls, conditions):
+        """Returns the conjunction of the conditions, evaluated but not simplified: the comparison does not need it"""
+        from sympy import sympify
         conditions_tab = conditions.split("\\&")
         final_conditions = None
         for condition in conditions_tab:
@@ -93,7 +109,13 @@ class MathSetProblem(MathProblem):
                 final_conditions = sympify(condition)
             else:
                 final_conditions = sympify(condition & final_conditions)
-        return simplify(final_conditions)
+        return final_conditions.doit()
+
+    def get_answer_key_signature(self):
+        return super().get_answer_key_signature() + (self._set_type, self._set_window, self._set_fallback)
+
+    def get_comparison_signature(self):
+        return super().get_comparison_signature() + (self._set_window, self._set_fallback)
 
     def get_format(self):
         if self._set_type == "explicit":
@@ -102,11 +124,65 @@ class MathSetProblem(MathProblem):
             return "Implicit: {x|x<4|N}"
         return math_format
 
-    def is_equal(self, eq1, eq2):
-        """Redfines the is_equal to only accept Intervals and Unions"""
+    def evaluate_numerically(self, eq):
+        """Returns the keys of the elements of an explicit set (see sets.get_element_keys), or None"""
+        from inginious_problems_math import sets
+        with metrics.timer("fingerprint"):
+            return sets.get_element_keys(eq, lambda element: MathProblem.get_fingerprint(self, element))
+
+    def get_fingerprint(self, eq):
+        """Explicit sets are fingerprinted by the keys of their elements"""
+        return self.get_keys_fingerprint(self.evaluate_numerically(eq))
+
+    def get_entry_fingerprint(self, entry):
+        if "fingerprint" not in entry:
+            entry["fingerprint"] = self.get_keys_fingerprint(entry["values"])
+        return entry["fingerprint"]
+
+    def get_keys_fingerprint(self, keys):
+        from inginious_problems_math import fingerprint, sets
+        if keys is None:
+            return None
+        return fingerprint.Fingerprint("set:" + sets.get_key(keys), None)
+
+    def compare_entries(self, entry1, entry2):
+        """Compares the explicit sets by the keys of their elements. The other sets are compared by the membership
+        of sample points, then, if this cannot tell, by their solutions (see set_fallback), and last once simplified"""
+        from inginious_problems_math import sets
+        if entry1["values"] is not None and entry2["values"] is not None:
+            with metrics.timer("compare"):
+                return sets.compare_elements(entry1["values"], entry2["values"], self.compare_elements)
+        with metrics.timer("membership"):
+            verdict = sets.compare_by_membership(entry1["answer"], entry2["answer"], self._set_window)
+        if verdict is None and self._set_fallback == "solveset":
+            with metrics.timer("solveset"):
+                try:
+                    verdict = sets.compare_solutions(entry1["answer"], entry2["answer"])
+                except Exception:
+                    verdict = None
+        if verdict is not None:
+            return verdict
+        canonical1, canonical2 = self.get_canonical(entry1), self.get_canonical(entry2)
+        with metrics.timer("compare"):
+            return self.compare_canonical(canonical1, canonical2)
+
+    def compare_elements(self, element1, element2):
+        """Compares two elements of explicit sets sharing their key, one of them not being a number"""
+        from sympy import simplify
+        with metrics.timer("simplify"):
+            return element1 == element2 or simplify(element1 - element2) == 0
+
+    def canonicalize(self, eq):
+        from sympy import simplify
+        with metrics.timer("simplify"):
+            return simplify(eq)
+
+    def compare_canonical(self, eq1, eq2):
+        """Redefines the comparison to only accept sets"""
+        from sympy import Intersection, Union, FiniteSet, ConditionSet, EmptySet
         #Sets
         if type(eq1) in [Intersection, Union, FiniteSet, ConditionSet] and type(eq2) in [Intersection, Union, FiniteSet, ConditionSet]:
-            return eq1 == eq2 or simplify(eq1) == simplify(eq2)
+            return eq1 == eq2
         elif eq1 == EmptySet and eq2 == EmptySet:
             return True
         return False
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Per-stage timers and outcome counters of the grading. They are disabled until a sink is set """
+
+import bisect
+import logging
+import threading
+import time
+
+# Receives the measures, None disables them
+sink = None
+
+
+class _NullTimer(object):
+    """Timer used while the metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+    __slots__ = ("_sink", "_stage", "_start")
+
+    def __init__(self, current_sink, stage):
+        self._sink = current_sink
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._sink.observe(self._stage, time.perf_counter() - self._start)
+        return False
+
+
+def timer(stage):
+    """Returns a context manager measuring the duration of a grading stage"""
+    if sink is None:
+        return _null_timer
+    return _Timer(sink, stage)
+
+
+def count(name, value):
+    """Counts an outcome, for instance the verdicts of the grading"""
+    if sink is not None:
+        sink.count(name, value)
+
+
+def set_sink(new_sink):
+    """Sets the sink receiving the measures, None disables them"""
+    global sink
+    sink = new_sink
+
+
+class LoggingSink(object):
+    """Emits a log record per measure, with the stage and duration (or the counter and value) as extra fields"""
+
+    def __init__(self, level=logging.DEBUG):
+        self._logger = logging.getLogger("inginious.webapp.plugin.math.metrics")
+        self._level = level
+
+    def observe(self, stage, duration):
+        self._logger.log(self._level, "stage %s took %.6fs", stage, duration,
+                         extra={"stage": stage, "duration": duration})
+
+    def count(self, name, value):
+        self._logger.log(self._level, "%s: %s", name, value, extra={"counter": name, "value": value})
+
+
+class HistogramSink(object):
+    """Aggregates the measures in memory, as a histogram of durations per stage and a count per outcome"""
+
+    default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+    def __init__(self, buckets=default_buckets):
+        self._buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, stage, duration):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = {"buckets": [0] * (len(self._buckets) + 1), "sum": 0.0, "count": 0}
+            histogram["buckets"][bisect.bisect_left(self._buckets, duration)] += 1
+            histogram["sum"] += duration
+            histogram["count"] += 1
+
+    def count(self, name, value):
+        with self._lock:
+            self._counters[(name, value)] = self._counters.get((name, value), 0) + 1
+
+    def snapshot(self):
+        """Returns a copy of the histograms, keyed by stage, and of the counters, keyed by (name, value)"""
+        with self._lock:
+            histograms = {stage: {"buckets": list(histogram["buckets"]), "sum": histogram["sum"],
+                                  "count": histogram["count"]} for stage, histogram in self._histograms.items()}
+            return histograms, dict(self._counters)
+
+    def to_prometheus(self):
+        """Returns the measures in the Prometheus text exposition format"""
+        histograms, counters = self.snapshot()
+        lines = ["# HELP inginious_math_stage_seconds Duration of the grading stages of the math problems",
+                 "# TYPE inginious_math_stage_seconds histogram"]
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(self._buckets + ["+Inf"], histogram["buckets"]):
+                cumulative += bucket
+                lines.append('inginious_math_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, cumulative))
+            lines.append('inginious_math_stage_seconds_sum{{stage="{}"}} {}'.format(stage, histogram["sum"]))
+            lines.append('inginious_math_stage_seconds_count{{stage="{}"}} {}'.format(stage, histogram["count"]))
+        lines += ["# HELP inginious_math_outcomes_total Outcomes of the grading of the math problems",
+                  "# TYPE inginious_math_outcomes_total counter"]
+        for (name, value), total in sorted(counters.items()):
+            lines.append('inginious_math_outcomes_total{{name="{}",value="{}"}} {}'.format(name, value, total))
+        return "\n".join(lines) + "\n"
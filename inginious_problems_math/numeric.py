@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Randomized numerical evaluation of answers, used to reject wrong answers before any simplification """
+
+import zlib
+
+import numpy
+from sympy import Expr, lambdify
+
+# The parser keeps two-argument logarithms unevaluated, which numpy.log does not handle
+functions = {"log": lambda x, base=None: numpy.log(x) if base is None else numpy.log(x) / numpy.log(base)}
+
+
+def symbol_samples(name, count, use_complex):
+    """Returns the sample points of a symbol. The points only depend on the symbol name, so that
+    the values of an answer key can be computed once and compared to any student answer"""
+    rng = numpy.random.default_rng(zlib.crc32(name.encode("utf-8")))
+    if use_complex:
+        return rng.uniform(-2.0, 2.0, count) + 1j * rng.uniform(-2.0, 2.0, count)
+    # Positive reals keep logarithms and roots on their principal, real branch
+    return rng.uniform(0.5, 2.5, count).astype(complex)
+
+
+def evaluate(eq, count, use_complex=False):
+    """Evaluates eq at count sample points of its free symbols. Returns an array of complex values,
+    or None if eq is not an expression that can be evaluated numerically"""
+    if count <= 0 or not isinstance(eq, Expr):
+        return None
+    symbols = sorted(eq.free_symbols, key=lambda symbol: symbol.name)
+    try:
+        function = lambdify(symbols, eq, modules=[functions, "numpy"])
+        with numpy.errstate(all="ignore"):
+            values = function(*[symbol_samples(symbol.name, count, use_complex) for symbol in symbols])
+            return numpy.broadcast_to(numpy.asarray(values, dtype=complex), (count,))
+    except Exception:
+        return None
+
+
+def differ(values1, values2, rtol=1e-6, atol=1e-9, reject_ratio=0.5):
+    """Tells if two evaluations clearly differ: at least reject_ratio of the points where both are
+    defined must disagree. Returns False when undecidable, the symbolic comparison then decides"""
+    if values1 is None or values2 is None or values1.shape != values2.shape:
+        return False
+    defined = numpy.isfinite(values1) & numpy.isfinite(values2)
+    if defined.sum() < max(1, len(defined) // 2):
+        return False
+    with numpy.errstate(all="ignore"):
+        mismatches = ~numpy.isclose(values1[defined], values2[defined], rtol=rtol, atol=atol)
+    return mismatches.mean() >= reject_ratio
@@ -5,18 +5,23 @@
 
 import json
 import os
-from operator import itemgetter
 
+from flask import request
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 from inginious.frontend.parsable_text import ParsableText
 from inginious_problems_math.math_problem import MathProblem
+from inginious_problems_math.answer_stats import get_top_answers
 
 PATH_TO_PLUGIN = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir)
 PATH_TO_TEMPLATES = os.path.join(PATH_TO_PLUGIN, "templates")
+# Tasks listed per page
+tasks_per_page = 20
 
 
 class AnswersPage(INGIniousAdminPage):
     def GET_AUTH(self, courseid):  # pylint: disable=arguments-differ
+        """Lists the top answers of the math problems of a page of tasks. The answers are clustered when they are
+        counted: the page only reads them"""
         course, __ = self.get_course_and_check_rights(courseid, allow_all_staff=False)
         data = {}
         tasks = course.get_tasks(True)
@@ -27,23 +32,21 @@ class AnswersPage(INGIniousAdminPage):
                     data.setdefault(taskid, {})["task"] = task
                     data[taskid].setdefault("pid", {})[problem.get_id()] = problem
 
-        # Fetch user tasks
+        taskids = list(data.keys())
+        pages = max(1, (len(taskids) + tasks_per_page - 1) // tasks_per_page)
+        try:
+            page = min(max(int(request.args.get("page", 1)), 1), pages)
+        except ValueError:
+            page = 1
+        taskids = taskids[(page - 1) * tasks_per_page:page * tasks_per_page]
+        data = {taskid: data[taskid] for taskid in taskids}
+
+        top_answers = get_top_answers(self.database, courseid, taskids)
         for taskid, item in data.items():
-            states = self.database.user_tasks.aggregate([
-                {"$match" : {"courseid": courseid, "taskid": taskid}},
-                {"$group": {"_id": "$state"}}
-            ])
-            # Parse the task state for each user
-            states = [json.loads(state["_id"]) if state["_id"] else {} for state in states]
-
-            for pid in data[taskid]["pid"].keys():
-                task_ans = data[taskid].setdefault("answers", {})
-                for state in states:
-                    if state:
-                        p_ans = task_ans.setdefault(pid, {})
-                        p_ans[state.get(pid)] = p_ans.get(state.get(pid), 0) + 1
-                task_ans[pid] = sorted([(json.loads(ans), count) for ans, count in task_ans.get(pid, {}).items() if ans],
-                                       key=itemgetter(1), reverse=True)
+            task_ans = item.setdefault("answers", {})
+            for pid in item["pid"].keys():
+                task_ans[pid] = [(json.loads(ans), count, [json.loads(variant) for variant in variants if variant != ans])
+                                 for ans, count, variants in top_answers.get(taskid, {}).get(pid, [])]
 
         return self.template_helper.render("answers.html", template_folder=PATH_TO_TEMPLATES, course=course,
-                                           data=data, ParsableText=ParsableText)
+                                           data=data, ParsableText=ParsableText, page=page, pages=pages)
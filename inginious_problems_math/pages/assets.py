@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import mimetypes
+
+from flask import request, send_file
+from flask.views import MethodView
+from werkzeug.exceptions import NotFound
+
+# Files are named after their content: they never change
+max_age = 365 * 24 * 3600
+
+
+class AssetPage(MethodView):
+    """Serves the static files of the plugin (see assets), in the encoding preferred by the browser. It does not
+    need the session of the user, unlike the INGIniousPage"""
+
+    # Assets served, set by the plugin configuration
+    assets = None
+
+    def get(self, filename):
+        variant = self.assets.negotiate(filename, request.accept_encodings)
+        if variant is None:
+            raise NotFound()
+        path, encoding = variant
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                             download_name=filename, etag="{}-{}".format(filename, encoding), max_age=max_age)
+        if encoding != "identity":
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
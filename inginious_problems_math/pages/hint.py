@@ -3,21 +3,66 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 
+import hashlib
 import json
 
-from flask import request
+from flask import request, Response
 from werkzeug.exceptions import Forbidden
 from inginious.frontend.pages.utils import INGIniousAuthPage
 from inginious.frontend.pages.course import handle_course_unavailable
 from inginious.frontend.parsable_text import ParsableText
 
+from inginious_problems_math.cache import LRUCache
+
+# Rendered hints, as (html, etag), keyed on (course id, task id, problem id, language, task revision): editing
+# the task changes its revision, so that the hints rendered before are not used anymore
+hint_cache = LRUCache(maxsize=1024)
+# Problems of the tasks by id, keyed on (course id, task id, task revision)
+problem_indexes = LRUCache(maxsize=256)
+
+
+def get_problem(courseid, task, revision, problemid):
+    """Returns the problem of a task with the given id, or None"""
+    key = (courseid, task.get_id(), revision)
+    index = problem_indexes.get(key)
+    if index is None:
+        index = {problem.get_id(): problem for problem in task.get_problems()}
+        problem_indexes.put(key, index)
+    return index.get(problemid)
+
+
+def render_hints(courseid, task, revision, problemid, language):
+    """Returns the hints of a problem rendered in the given language, as (html, etag)"""
+    key = (courseid, task.get_id(), problemid, language, revision)
+    rendered = hint_cache.get(key)
+    if rendered is None:
+        problem = get_problem(courseid, task, revision, problemid)
+        hints = ""
+        if problem is not None:
+            hints = str(ParsableText(problem.gettext(language, problem._hints), "rst",
+                                     translation=problem.get_translation_obj(language)))
+        rendered = (hints, hashlib.sha1(hints.encode("utf-8")).hexdigest())
+        hint_cache.put(key, rendered)
+    return rendered
+
 
 class HintPage(INGIniousAuthPage):
     def is_lti_page(self):
         return self.user_manager.session_lti_info() is not None
 
+    def GET_AUTH(self):
+        return self.show_hints(request.args)
+
     def POST_AUTH(self):
-        data = request.form
+        return self.show_hints(request.form)
+
+    def get_revision(self, courseid, taskid, task):
+        """Returns the last modification time of the task descriptor"""
+        extension = self.course_factory.get_task_factory().get_task_descriptor_extension(courseid, taskid)
+        return task.get_fs().get_last_modification_time("task." + extension)
+
+    def show_hints(self, data):
+        """Returns the rendered hints of a problem. They may be revalidated by the browser with their ETag"""
         username = self.user_manager.session_username()
         language = self.user_manager.session_language()
         courseid = data.get("courseid", None)
@@ -32,12 +77,7 @@ class HintPage(INGIniousAuthPage):
             raise Forbidden(_("Task unavailable"))
 
         problemid = data.get("problemid", "")
-        problems = task.get_problems()
-        hints = ""
-        for problem in problems:
-            if problem.get_id() == problemid:
-                hints = str(ParsableText(problem.gettext(language, problem._hints), "rst",
-                                    translation=problem.get_translation_obj(language)))
+        hints, etag = render_hints(courseid, task, self.get_revision(courseid, taskid, task), problemid, language)
 
         #TODO: Uncomment me when state and hints are fully implemented
         #if hints:
@@ -52,4 +92,9 @@ class HintPage(INGIniousAuthPage):
         #    self.database.user_tasks.update_one({"username": username, "courseid": courseid,
         #                                         "taskid": taskid}, {"$set": {"state": json.dumps(state)}})
 
-        return hints
+        # The hints depend on the user's access: they are only stored by the browser, and revalidated on each use
+        response = Response(hints, mimetype="text/html")
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import hmac
+import ipaddress
+
+from flask import request, Response
+from werkzeug.exceptions import Forbidden
+from inginious.frontend.pages.utils import INGIniousPage
+
+from inginious_problems_math import metrics
+
+
+class MetricsPage(INGIniousPage):
+    """Exposes the grading measures of the in-memory histogram sink in the Prometheus text format. They are only
+    shown to the superadmins, and to the scrapers sending the configured token or connecting from an allowed
+    address"""
+
+    # Bearer token and networks of the scrapers, set by the plugin configuration
+    token = None
+    allowed_networks = []
+
+    def is_allowed(self):
+        if self.token and hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer " + self.token):
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or "")
+        except ValueError:
+            address = None
+        if address is not None and any(address in network for network in self.allowed_networks):
+            return True
+        return self.user_manager.session_logged_in() and self.user_manager.user_is_superadmin()
+
+    def GET(self):
+        if not self.is_allowed():
+            raise Forbidden()
+        return Response(metrics.sink.to_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Regrades the past submissions of math problems, after an answer key fix for instance """
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bson
+from pymongo import DESCENDING, MongoClient, UpdateOne
+from gridfs import GridFS
+
+from inginious.common.base import load_json_or_yaml
+from inginious_problems_math.grading_pool import GradingPool
+from inginious_problems_math.math_problem import MathProblem
+from inginious_problems_math.math_matrix import MathMatrixProblem
+from inginious_problems_math.math_interval import MathIntervalProblem
+from inginious_problems_math.math_set import MathSetProblem
+
+problem_types = {cls.get_type(): cls for cls in [MathProblem, MathMatrixProblem, MathIntervalProblem, MathSetProblem]}
+# Internal messages, as translated by the INGInious MCQ agent
+internal_messages = {"_wrong_answer": "Wrong answer", "_correct_answer": "Correct answer"}
+
+
+def get_config(configfile):
+    if not configfile:
+        if os.path.isfile("./configuration.yaml"):
+            configfile = "./configuration.yaml"
+        elif os.path.isfile("./configuration.json"):
+            configfile = "./configuration.json"
+        else:
+            raise Exception("No configuration file found")
+
+    return load_json_or_yaml(configfile)
+
+
+def load_task_problems(tasks_directory, courseid, taskid):
+    """Returns the list of the problems of a task, math problems being instantiated and others left as None"""
+    task_content = load_json_or_yaml(os.path.join(tasks_directory, courseid, taskid, "task.yaml"))
+    problems = []
+    for problemid, content in task_content.get("problems", {}).items():
+        problem_class = problem_types.get(content.get("type", ""))
+        problems.append(problem_class(problemid, content, {}, None) if problem_class else None)
+    return problems
+
+
+def get_input(gridfs, submission):
+    """Returns the input of a submission, which is either inline or stored in GridFS"""
+    if isinstance(submission["input"], dict):
+        return submission["input"]
+    return bson.BSON.decode(gridfs.get(submission["input"]).read())
+
+
+def grade_all(problems_answers, pool=None, workers=1):
+    """Grades each distinct (problem id, normalized inputs) key once, in parallel. problems_answers maps those
+    keys to a (problem, raw inputs) pair. Returns a dict of key -> verdict"""
+    def grade(item):
+        problem, inputs = item
+        return pool.grade(problem, list(inputs)) if pool is not None else problem.grade(list(inputs))
+
+    keys = list(problems_answers.keys())
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        verdicts = list(executor.map(grade, [problems_answers[key] for key in keys]))
+    return dict(zip(keys, verdicts))
+
+
+def get_feedback(problem, verdict, language):
+    """Returns the result and the feedback stored in a submission for a verdict returned by grade"""
+    valid, __, messages = problem.get_feedback(verdict[0], verdict[1], language)
+    messages = [internal_messages.get(message, message) for message in messages]
+    return ["success" if valid else "failed", "\n\n".join(messages)]
+
+
+def get_evaluation_mode(tasks_directory, courseid, taskid):
+    """Returns the evaluation mode of a task, "best" or "last": the submission whose grade is the grade of
+    the student. It is set in the task dispenser configuration of the course, or in the task for older ones"""
+    course_file = os.path.join(tasks_directory, courseid, "course.yaml")
+    course_content = load_json_or_yaml(course_file) if os.path.isfile(course_file) else {}
+    dispenser_data = course_content.get("dispenser_data", {})
+    task_config = dispenser_data.get("config", {}).get(taskid, {}) if isinstance(dispenser_data, dict) else {}
+    if "evaluation_mode" in task_config:
+        return task_config["evaluation_mode"]
+    task_content = load_json_or_yaml(os.path.join(tasks_directory, courseid, taskid, "task.yaml"))
+    return "last" if task_content.get("evaluate") == "last" else "best"
+
+
+def update_user_tasks(database, courseid, taskid, usernames, evaluation_mode="best"):
+    """Updates the grades cached in the user tasks of the given users from their submissions, as INGInious
+    does after replaying a submission"""
+    for username in usernames:
+        query = {"username": username, "courseid": courseid, "taskid": taskid, "status": "done"}
+        if evaluation_mode == "last":
+            order = [("submitted_on", DESCENDING)]
+        else:
+            order = [("grade", DESCENDING), ("submitted_on", DESCENDING)]
+        submission = next(iter(database.submissions.find(query).sort(order).limit(1)), None)
+        if submission is None:
+            continue
+        database.user_tasks.update_one({"username": username, "courseid": courseid, "taskid": taskid},
+                                       {"$set": {"succeeded": submission.get("result") == "success",
+                                                 "grade": submission.get("grade", 0.0),
+                                                 "state": submission.get("state", ""),
+                                                 "submissionid": submission["_id"]}})
+
+
+def regrade_task(database, gridfs, courseid, taskid, problems, pool=None, workers=1, dry_run=False,
+                 batch_size=500, logger=None, evaluation_mode="best"):
+    """Regrades the math problems of all the submissions of a task, batch by batch. Returns the number of
+    submissions and of distinct answers checked, and the number of submissions whose result changed.
+    Submissions with an answer that timed out or failed to be checked are left unchanged"""
+    logger = logger or logging.getLogger("inginious.math.regrade")
+    math_problems = [problem for problem in problems if problem is not None]
+    if not math_problems:
+        return 0, 0, 0
+
+    # Verdicts of the distinct normalized answers, kept across the batches
+    verdicts = {}
+    counts = {"submissions": 0, "changed": 0, "skipped": 0}
+    usernames = set()
+    # Only tasks made of math problems can have their grade recomputed, others depend on the grading container
+    pure_math = len(math_problems) == len(problems)
+
+    def regrade_batch(batch):
+        problems_answers = {}
+        submissions = []
+        for submission in batch:
+            inputdata = get_input(gridfs, submission)
+            keys = {}
+            for problem in math_problems:
+                if problem.get_id() not in inputdata:
+                    continue
+                inputs = tuple(problem.normalize_answer(eq) for eq in inputdata[problem.get_id()])
+                # Normalization is not idempotent, the raw inputs of the first submission are graded
+                if (problem.get_id(), inputs) not in verdicts:
+                    problems_answers.setdefault((problem.get_id(), inputs), (problem, inputdata[problem.get_id()]))
+                keys[problem.get_id()] = inputs
+            submissions.append((submission, keys, inputdata.get("@lang", "en")))
+        verdicts.update(grade_all(problems_answers, pool, workers))
+
+        requests = []
+        for submission, keys, language in submissions:
+            submission_verdicts = {problemid: verdicts[(problemid, inputs)] for problemid, inputs in keys.items()}
+            # A slow or failing check does not tell the answer is wrong
+            if any(verdict[0] in ["timeout", "error"] for verdict in submission_verdicts.values()):
+                counts["skipped"] += 1
+                continue
+            updates = {}
+            errors = 0
+            for problem in math_problems:
+                if problem.get_id() not in keys:
+                    errors += 1
+                    continue
+                result = get_feedback(problem, submission_verdicts[problem.get_id()], language)
+                errors += result[0] != "success"
+                if list(submission.get("problems", {}).get(problem.get_id(), [])) != result:
+                    updates["problems." + problem.get_id()] = result
+            if pure_math:
+                grade = 100.0 * float(len(problems) - errors) / float(len(problems))
+                result = "success" if errors == 0 else "failed"
+                if submission.get("grade") != grade or submission.get("result") != result:
+                    updates["grade"] = grade
+                    updates["result"] = result
+            if updates:
+                requests.append(UpdateOne({"_id": submission["_id"]}, {"$set": updates}))
+                if "grade" in updates:
+                    usernames.update(submission.get("username", []))
+        counts["submissions"] += len(batch)
+        counts["changed"] += len(requests)
+        if requests and not dry_run:
+            database.submissions.bulk_write(requests, ordered=False)
+        logger.info("%s/%s: %s submissions regraded, %s distinct answers", courseid, taskid, counts["submissions"],
+                    len(verdicts))
+
+    batch = []
+    cursor = database.submissions.find({"courseid": courseid, "taskid": taskid, "status": "done"},
+                                       {"input": 1, "problems": 1, "grade": 1, "result": 1, "username": 1},
+                                       batch_size=batch_size)
+    for submission in cursor:
+        batch.append(submission)
+        if len(batch) >= batch_size:
+            regrade_batch(batch)
+            batch = []
+    if batch:
+        regrade_batch(batch)
+
+    if usernames and not dry_run:
+        update_user_tasks(database, courseid, taskid, sorted(usernames), evaluation_mode)
+    if counts["skipped"]:
+        logger.warning("%s/%s: %s submissions left unchanged, an answer could not be checked", courseid, taskid,
+                       counts["skipped"])
+    logger.info("%s/%s: %s submissions %s", courseid, taskid, counts["changed"], "would change" if dry_run else "updated")
+    return counts["submissions"], len(verdicts), counts["changed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regrades the past submissions of math problems")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("-t", "--task", help="Task to regrade (all the tasks of the course if omitted)", default=None)
+    parser.add_argument("-w", "--workers", help="Number of grading processes", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", help="Deadline of each check, in seconds", type=int, default=30)
+    parser.add_argument("-n", "--dry-run", help="Report the changes without writing them", action='store_true')
+    parser.add_argument("course", help="Course to regrade")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    logger = logging.getLogger("inginious.math.regrade")
+
+    config = get_config(args.config)
+    mongo_client = MongoClient(host=config.get('mongo_opt', {}).get('host', 'localhost'))
+    database = mongo_client[config.get('mongo_opt', {}).get('database', 'INGInious')]
+    gridfs = GridFS(database)
+    tasks_directory = config.get("tasks_directory", "./tasks")
+
+    taskids = [args.task] if args.task else sorted(
+        taskid for taskid in os.listdir(os.path.join(tasks_directory, args.course))
+        if os.path.isfile(os.path.join(tasks_directory, args.course, taskid, "task.yaml")))
+
+    pool = GradingPool(args.workers, args.timeout)
+    try:
+        for taskid in taskids:
+            problems = load_task_problems(tasks_directory, args.course, taskid)
+            regrade_task(database, gridfs, args.course, taskid, problems, pool, args.workers, args.dry_run, logger=logger,
+                         evaluation_mode=get_evaluation_mode(tasks_directory, args.course, taskid))
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Membership-based comparison of sets of real numbers, such as the implicit sets {x|condition|domain}.
+Both sets are tested on the integers of a window, a grid of reals when one of them is not discrete, the numbers
+of their conditions and bounds with their neighbours, and far points. The points where they disagree are
+checked exactly with sympy before the sets are told different. Sampling only proves that sets differ: sets
+agreeing on every point are only told equal when both are sets of integers within the window, whose membership is
+then checked exactly for each of these integers. Explicit sets are first compared by the keys of their elements, without building their membership """
+
+from fractions import Fraction
+
+import numpy
+from sympy import (And, Complement, ConditionSet, FiniteSet, Intersection, Interval, Number, NumberSymbol, Range,
+                   Not, Or, Rational, S, Union, lambdify, oo, solveset)
+
+# Number of disagreeing points checked exactly before telling the sets different
+exact_checks = 5
+# Distance to the numbers of the conditions of the points around them
+neighbour_distances = [Fraction(1), Fraction(1, 2), Fraction(1, 10 ** 6)]
+# Points of the real grid per unit
+grid_density = 4
+far_points = [sign * (10 ** k + offset) for k in range(3, 13) for sign in [-1, 1] for offset in [0, Fraction(1, 2)]]
+
+
+class Undecidable(Exception):
+    pass
+
+
+class Membership(object):
+    """Membership test of a set: contains tells which points, a float array, belong to it, and exact_contains if a
+    single sympy number does (Undecidable if sympy cannot tell). numbers are the sympy numbers its bounds and
+    conditions depend on, real tells if it contains non-integers, and bounds are the (lower, upper) integers
+    between which the elements of a set of integers lie, None if it is unbounded or contains non-integers"""
+
+    def __init__(self, contains, exact_contains, numbers, real, bounds=None):
+        self.contains = contains
+        self.exact_contains = exact_contains
+        self.numbers = numbers
+        self.real = real
+        self.bounds = bounds
+
+
+def is_integer(points):
+    return numpy.isfinite(points) & (points == numpy.floor(points))
+
+
+def exact_value(boolean):
+    if boolean not in [S.true, S.false, True, False]:
+        raise Undecidable
+    return bool(boolean)
+
+
+def integers(lower, upper):
+    """Membership of the integers between two bounds, included, None for an unbounded side"""
+    def contains(points):
+        result = is_integer(points)
+        if lower is not None:
+            result &= points >= lower
+        if upper is not None:
+            result &= points <= upper
+        return result
+
+    def exact_contains(point):
+        return bool(point.is_integer) and (lower is None or exact_value(point >= lower)) and \
+            (upper is None or exact_value(point <= upper))
+
+    bounds = (lower, upper) if lower is not None and upper is not None else None
+    return Membership(contains, exact_contains, {Rational(bound) for bound in [lower, upper] if bound is not None},
+                      False, bounds)
+
+
+def get_numbers(expr):
+    return {atom for atom in expr.atoms(Number, NumberSymbol) if atom.is_finite and atom.is_real}
+
+
+def combine_bounds(bounds, union):
+    """Returns the bounds of the union or the intersection of sets with the given bounds"""
+    if union:
+        if any(bound is None for bound in bounds):
+            return None
+        return min(lower for lower, _ in bounds), max(upper for _, upper in bounds)
+    bounds = [bound for bound in bounds if bound is not None]
+    if not bounds:
+        return None
+    return max(lower for lower, _ in bounds), min(upper for _, upper in bounds)
+
+
+def get_membership(eq):
+    """Returns the Membership of a sympy set, or None if it is not supported"""
+    if eq is S.EmptySet:
+        return Membership(lambda points: numpy.zeros(points.shape, dtype=bool), lambda point: False, set(), False,
+                          (0, -1))
+    if eq is S.Reals:
+        return Membership(lambda points: numpy.isfinite(points), lambda point: True, set(), True)
+    if eq is S.Naturals:
+        return integers(1, None)
+    if eq is S.Naturals0:
+        return integers(0, None)
+    if eq is S.Integers:
+        return integers(None, None)
+    if isinstance(eq, FiniteSet):
+        if not all(element.is_number and element.is_real for element in eq.args):
+            return None
+        values = numpy.array([float(element) for element in eq.args])
+        real = not all(element.is_integer for element in eq.args)
+        bounds = None if real else (int(min(eq.args)), int(max(eq.args)))
+        return Membership(lambda points: numpy.isin(points, values), lambda point: exact_value(eq.contains(point)),
+                          get_numbers(eq), real, bounds)
+    if isinstance(eq, Interval):
+        if not (eq.left.is_number and eq.right.is_number):
+            return None
+        left, right = float(eq.left), float(eq.right)
+
+        def contains(points):
+            return ((points > left) if eq.left_open else (points >= left)) & \
+                ((points < right) if eq.right_open else (points <= right))
+
+        return Membership(contains, lambda point: exact_value(eq.contains(point)), get_numbers(eq), True)
+    if isinstance(eq, Range):
+        if not (eq.inf.is_number and eq.sup.is_number and eq.step.is_number):
+            return None
+        inf, sup, step = eq.inf, eq.sup, int(abs(eq.step))
+        bounds = integers(None if inf.is_infinite else int(inf), None if sup.is_infinite else int(sup))
+        # The elements are congruent to the finite bound
+        start = int(sup) if inf.is_infinite and not sup.is_infinite else (0 if inf.is_infinite else int(inf))
+        return Membership(lambda points: bounds.contains(points) & ((points - start) % step == 0),
+                          lambda point: exact_value(eq.contains(point)), bounds.numbers, False, bounds.bounds)
+    if isinstance(eq, ConditionSet):
+        base = get_membership(eq.base_set)
+        if base is None or not eq.condition.free_symbols <= {eq.sym}:
+            return None
+        try:
+            predicate = lambdify(eq.sym, eq.condition, modules="numpy")
+        except Exception:
+            return None
+
+        def contains(points):
+            with numpy.errstate(all="ignore"):
+                values = numpy.broadcast_to(numpy.asarray(predicate(points), dtype=bool), points.shape)
+            return base.contains(points) & values
+
+        def exact_contains(point):
+            return base.exact_contains(point) and exact_value(eq.condition.subs(eq.sym, point))
+
+        return Membership(contains, exact_contains, base.numbers | get_numbers(eq.condition), base.real, base.bounds)
+    if isinstance(eq, (Union, Intersection, Complement)):
+        memberships = [get_membership(arg) for arg in eq.args]
+        if any(membership is None for membership in memberships):
+            return None
+        numbers = set().union(*[membership.numbers for membership in memberships])
+        if isinstance(eq, Complement):
+            first, second = memberships
+            return Membership(lambda points: first.contains(points) & ~second.contains(points),
+                              lambda point: first.exact_contains(point) and not second.exact_contains(point),
+                              numbers, first.real, first.bounds)
+        combine = any if isinstance(eq, Union) else all
+        reduce = numpy.logical_or if isinstance(eq, Union) else numpy.logical_and
+        return Membership(lambda points: reduce.reduce([membership.contains(points) for membership in memberships]),
+                          lambda point: combine(membership.exact_contains(point) for membership in memberships),
+                          numbers, combine(membership.real for membership in memberships),
+                          combine_bounds([membership.bounds for membership in memberships], isinstance(eq, Union)))
+    return None
+
+
+def get_points(numbers, window, real):
+    """Returns the sample points, as exact values (Fraction or sympy numbers), without duplicates"""
+    points = set(range(-window, window + 1))
+    if real:
+        points.update(Fraction(k, grid_density) for k in range(-window * grid_density, window * grid_density + 1))
+    points.update(far_points)
+    for number in numbers:
+        for value in [number, -number]:
+            points.add(value)
+            for distance in neighbour_distances:
+                points.add(value + Rational(distance.numerator, distance.denominator))
+                points.add(value - Rational(distance.numerator, distance.denominator))
+    return sorted(points, key=float)
+
+
+def to_sympy(point):
+    if isinstance(point, Fraction):
+        return Rational(point.numerator, point.denominator)
+    if isinstance(point, int):
+        return Rational(point)
+    return point
+
+
+def compare_by_membership(eq1, eq2, window):
+    """Tells if two sets are equal from the membership of sample points, or returns None if this cannot be told.
+    Sets are only told equal when both are sets of integers between -window and window"""
+    membership1, membership2 = get_membership(eq1), get_membership(eq2)
+    if membership1 is None or membership2 is None:
+        return None
+    points = get_points(membership1.numbers | membership2.numbers, window, membership1.real or membership2.real)
+    try:
+        values = numpy.array([float(point) for point in points])
+        with numpy.errstate(all="ignore"):
+            disagreements = numpy.flatnonzero(membership1.contains(values) != membership2.contains(values))
+    except Exception:
+        return None
+
+    # Floating point errors may make a point on a bound disagree
+    for index in disagreements[:exact_checks]:
+        point = to_sympy(points[index])
+        try:
+            if membership1.exact_contains(point) != membership2.exact_contains(point):
+                return False
+        except (Undecidable, TypeError):
+            return None
+    if len(disagreements) > exact_checks or membership1.bounds is None or membership2.bounds is None:
+        return None
+    lower, upper = combine_bounds([membership1.bounds, membership2.bounds], True)
+    if lower < -window or upper > window:
+        return None
+    # The floating point membership of the other integers may be wrong too
+    for point in range(lower, upper + 1):
+        try:
+            if membership1.exact_contains(Rational(point)) != membership2.exact_contains(Rational(point)):
+                return False
+        except (Undecidable, TypeError):
+            return None
+    return True
+
+
+class ElementKey(object):
+    """Key of an element of an explicit set: key is its fingerprint key (see fingerprint), and value its exact
+    value if it is a number written as an integer, a decimal or a fraction, None otherwise"""
+
+    __slots__ = ("key", "value", "element")
+
+    def __init__(self, key, value, element):
+        self.key = key
+        self.value = value
+        self.element = element
+
+
+def get_element_keys(eq, get_fingerprint):
+    """Returns the keys of the elements of a FiniteSet, sorted, or None if eq is not a FiniteSet or an element
+    has no fingerprint. Decimals are taken as the fraction they are written as"""
+    if not isinstance(eq, FiniteSet):
+        return None
+    keys = []
+    for element in eq.args:
+        value = Rational(str(element)) if element.is_Float else (element if element.is_Rational else None)
+        fingerprint = get_fingerprint(element if value is None else value)
+        if fingerprint is None:
+            return None
+        keys.append(ElementKey(fingerprint.key, value, element))
+    keys.sort(key=lambda element_key: element_key.key)
+    return tuple(keys)
+
+
+def get_key(keys):
+    """Returns the key shared by the equal explicit sets: the keys of their distinct elements"""
+    return "|".join(sorted({element_key.key for element_key in keys}))
+
+
+def compare_elements(keys1, keys2, is_equal):
+    """Tells if two explicit sets, given by their element keys, are equal. Only the elements sharing their key
+    are compared: the exact values with each other, the other elements with is_equal"""
+    groups1, groups2 = {}, {}
+    for keys, groups in [(keys1, groups1), (keys2, groups2)]:
+        for element_key in keys:
+            groups.setdefault(element_key.key, []).append(element_key)
+    if groups1.keys() != groups2.keys():
+        return False
+
+    def same(element_key1, element_key2):
+        if element_key1.value is not None and element_key2.value is not None:
+            return element_key1.value == element_key2.value
+        return is_equal(element_key1.element, element_key2.element)
+
+    for key, group1 in groups1.items():
+        group2 = groups2[key]
+        if all(element_key.value is not None for element_key in group1 + group2):
+            if {element_key.value for element_key in group1} != {element_key.value for element_key in group2}:
+                return False
+            continue
+        if not all(any(same(element_key1, element_key2) for element_key2 in group2) for element_key1 in group1) or \
+                not all(any(same(element_key1, element_key2) for element_key1 in group1) for element_key2 in group2):
+            return False
+    return True
+
+
+# Domains sympy intersects better as ranges, such as the non-positive integers Z-
+ranges = {Complement(S.Integers, S.Naturals): Range(-oo, 1), Complement(S.Integers, S.Naturals0): Range(-oo, 0)}
+
+
+def solve_condition(condition, sym):
+    """Returns the real solutions of a condition, solving the conditions it combines one by one"""
+    if isinstance(condition, And):
+        return Intersection(*[solve_condition(arg, sym) for arg in condition.args])
+    if isinstance(condition, Or):
+        return Union(*[solve_condition(arg, sym) for arg in condition.args])
+    if isinstance(condition, Not):
+        return Complement(S.Reals, solve_condition(condition.args[0], sym))
+    return solveset(condition, sym, S.Reals)
+
+
+def solve(eq):
+    """Returns a ConditionSet solved with solveset, or None if it cannot be"""
+    if not isinstance(eq, ConditionSet):
+        return eq
+    solution = Intersection(solve_condition(eq.condition, eq.sym), eq.base_set.xreplace(ranges))
+    if solution.has(ConditionSet):
+        return None
+    return solution
+
+
+def compare_solutions(eq1, eq2):
+    """Tells if two sets are equal once their conditions are solved with solveset, or returns None if this
+    cannot be told"""
+    solution1, solution2 = solve(eq1), solve(eq2)
+    if solution1 is None or solution2 is None:
+        return None
+    difference = solution1.symmetric_difference(solution2)
+    if difference is S.EmptySet:
+        return True
+    if isinstance(difference, (FiniteSet, Interval, Range)):
+        return False
+    return None
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Problem states of the math problems, stored by INGInious in the state of the tasks. A state holds the
+normalized inputs of the student, sorted, and a key shared by the equivalent answers (see fingerprint), None if
+some answer has no fingerprint:
+
+    {"v": 2, "inputs": ["2x", "y"], "key": "5d1e0a1c3f8b2e4a"}
+
+A submission whose answer cannot be graded keeps the previous state, marked with "kept": true so that its
+answer is not counted again.
+The states of the first version were the JSON lists of the LaTeX printed from the parsed answers. They are read
+as states without key """
+
+import hashlib
+import json
+
+version = 2
+
+
+def make_state(inputs, fingerprints):
+    """Returns the state of the normalized inputs of a student, given the fingerprints of their answers"""
+    key = None
+    if fingerprints and all(fingerprint is not None for fingerprint in fingerprints):
+        keys = json.dumps(sorted(fingerprint.key for fingerprint in fingerprints))
+        key = hashlib.sha256(keys.encode("utf-8")).hexdigest()[:16]
+    return {"v": version, "inputs": sorted(inputs), "key": key}
+
+
+def read_state(state):
+    """Returns a problem state of any version as a state of the current one, or None if it holds no answer"""
+    if isinstance(state, dict):
+        if state.get("v") != version or not state.get("inputs"):
+            return None
+        return state
+    if not isinstance(state, str) or not state:
+        return None
+    try:
+        inputs = json.loads(state)
+    except ValueError:
+        return None
+    if not isinstance(inputs, list) or not inputs or not all(isinstance(eq, str) for eq in inputs):
+        return None
+    return {"v": version, "inputs": inputs, "key": None}
+
+
+def keep_state(state):
+    """Returns the previous state of a problem, kept by a submission that did not produce a new one"""
+    current = read_state(state)
+    if current is None:
+        return state
+    return dict(current, kept=True)
+
+
+def get_answer(state):
+    """Returns the answer of a state as counted by answer_stats: the JSON list of its inputs"""
+    return json.dumps(state["inputs"])
@@ -118,19 +118,80 @@ function math_add_answer(pid, data) {
     var div = $("<div></div>");
     var del_btn = $("<button></button>").attr("type", "button")
         .attr("class", "close")
-        .attr("onclick", "$(this).parent().remove();");
+        .attr("onclick", "$(this).parent().remove(); math_update_submit();");
     del_btn.html('<span>&times;</span>');
     var math_field = $("<div></div>").attr('id', 'math-field-' + index + '-' + pid);
     var math_input = $("<input></input>").attr('id', 'math-input-' + index + '-' + pid)
         .attr("name", pid)
         .attr("type", "hidden");
-    div.append(del_btn).append(math_field).append(math_input);
+    var math_error = $("<div></div>").attr("class", "math-validation");
+    div.append(del_btn).append(math_field).append(math_input).append(math_error);
     $("#math-fields-" + pid).append(div);
 
     var editor_answer = new MathEditor(index + "-" + pid, $("#collapse_" + pid));
     editor_answer.setLatex(data);
+    math_validate_input(math_input);
 }
 
+/////////////////////////////////////////////////////////////////////////////////
+// VALIDATION ///////////////////////////////////////////////////////////////////
+/////////////////////////////////////////////////////////////////////////////////
+
+// The answers are checked against the rules of the parsers of the problems before they are submitted: the
+// submission is blocked while an answer cannot be parsed. The math_validate_<type> functions return the error
+// of an answer, or "" if it may be parsed. The server still checks every answer
+
+function math_validate_input(input) {
+    var fields = input.closest("[data-problem-type]");
+    if(fields.length == 0) // Editors of the studio
+        return;
+    var latex = input.val();
+    var error = "";
+    if(latex !== "") {
+        var validate = window["math_validate_" + fields.data("problem-type")];
+        error = math_validate_braces(latex) || (validate ? validate(latex) : "");
+    }
+    input.siblings(".math-validation").text(error);
+    math_update_submit();
+}
+
+function math_has_errors() {
+    return $(".math-validation").filter(function() { return $(this).text() !== ""; }).length != 0;
+}
+
+function math_update_submit() {
+    $("form#task #task-submit").prop("disabled", math_has_errors());
+}
+
+function math_strip_delimiters(latex) {
+    return latex.replace(/\\(left|right)(?![a-zA-Z])/g, "");
+}
+
+function math_validate_braces(latex) {
+    var depth = 0;
+    var text = latex.replace(/\\[{}]/g, "");
+    for(var i = 0; i < text.length; i++) {
+        if(text[i] == "{")
+            depth++;
+        else if(text[i] == "}" && --depth < 0)
+            return "Unbalanced braces: a } is not opened";
+    }
+    if(depth > 0)
+        return "Unbalanced braces: a { is not closed";
+    if((latex.match(/\\left(?![a-zA-Z])/g) || []).length != (latex.match(/\\right(?![a-zA-Z])/g) || []).length)
+        return "Unbalanced brackets";
+    return "";
+}
+
+// The submit button is enabled again after each submission: the submission is also blocked here, before the
+// handler of the task form
+document.addEventListener("submit", function(e) {
+    if(e.target.id == "task" && math_has_errors()) {
+        e.preventDefault();
+        e.stopImmediatePropagation();
+    }
+}, true);
+
 $( document ).ready(function() {
     $(".math_modal").on('show.bs.modal', function (e) {
         var button = $(e.relatedTarget); // Button that triggered the modal
@@ -138,7 +199,7 @@ $( document ).ready(function() {
 
         $.ajax({
             url: homepath + '/plugins/math/hint',
-            type: 'post',
+            type: 'get',
             data: {courseid: courseid, taskid: taskid, problemid: problemid},
             success: function(response){
                 // Add response in Modal body
@@ -173,6 +234,19 @@ function math_matrix_create_answer(pid, choice_data) {
     return math_create_answer(pid,choice_data, "math_matrix")
 }
 
+function math_validate_math_matrix(latex) {
+    var rows = latex.replace(/\\left\[/g, "").replace(/\\right\]/g, "").split(":");
+    var columns = rows[0].split(",").length;
+    for(var i = 0; i < rows.length; i++) {
+        var elements = rows[i].split(",");
+        if(elements.length != columns)
+            return "Every row of the matrix must have the same number of elements, such as 1,2:3,4";
+        if(elements.indexOf("") != -1)
+            return "An element of the matrix is missing";
+    }
+    return "";
+}
+
 /////////////////////////////////////////////////////////////////////////////////
 // MATH INTERVAL ////////////////////////////////////////////////////////////////
 /////////////////////////////////////////////////////////////////////////////////
@@ -197,6 +271,24 @@ function math_interval_create_answer(pid, choice_data) {
     return math_create_answer(pid, choice_data, "math_interval");
 }
 
+function math_validate_math_interval(latex) {
+    var intervals = latex.split("\\cup");
+    for(var i = 0; i < intervals.length; i++) {
+        var interval = intervals[i];
+        var left_open = /^(\\left)?\(/.test(interval), right_open = /\)$/.test(interval);
+        if(intervals.length > 1 && !(/^(\\left)?[\[(]/.test(interval) && /[\])]$/.test(interval)))
+            return "Each interval of a union must be written between brackets, such as [a,b)\\cup(c,d]";
+        var borders = interval.replace(/^(\\left)?[\[(]/, "").replace(/(\\right)?[\])]$/, "").split(",");
+        if(borders.length == 1 && !left_open && !right_open) // Single element, such as [5]
+            continue;
+        if(borders.length != 2)
+            return "An interval must have two bounds separated by a comma, such as [a,b)";
+        if(borders[0] === "" || borders[1] === "")
+            return "A bound of an interval is missing";
+    }
+    return "";
+}
+
 /////////////////////////////////////////////////////////////////////////////////
 // MATH SET /////////////////////////////////////////////////////////////////////
 /////////////////////////////////////////////////////////////////////////////////
@@ -227,6 +319,29 @@ function math_set_create_answer(pid, choice_data) {
     return math_create_answer(pid, choice_data, "math_set")
 }
 
+function math_validate_math_set(latex) {
+    var set = latex.replace(/\\left\\\{/g, "{").replace(/\\right\\\}/g, "}");
+    if(set.indexOf("|") != -1) {
+        set = math_strip_delimiters(set);
+        if(set[0] != "{" || set[set.length - 1] != "}")
+            return "An implicit set must be written between braces, such as {x|x<4|N}";
+        var parts = set.slice(1, -1).split("|");
+        if(parts.length != 3)
+            return "An implicit set must have three parts separated by |, such as {x|x<4|N}";
+        if(parts.indexOf("") != -1)
+            return "A part of the implicit set is missing: {variable|condition|domain}";
+        return "";
+    }
+    var groups = set.split("\\cap");
+    for(var i = 0; i < groups.length; i++) {
+        var sets = groups[i].split("\\cup");
+        for(var j = 0; j < sets.length; j++)
+            if(sets[j][0] != "{" || sets[j][sets[j].length - 1] != "}")
+                return "Each set must be written between braces, such as {1,2}\\cup{3}";
+    }
+    return "";
+}
+
 function math_set_modify_format(pid, value){
     $("#format_edit-" + pid).text(value)
 }
@@ -26,7 +26,9 @@ function MathEditor(pid, collapse_div){
         spaceBehavesLikeTab: true, // configurable
         handlers: {
           edit: function() { // useful event handlers
-              $('input[id=math-input-' + $.escapeSelector(pid) + ']').val(ab.latex());
+              var input = $('input[id=math-input-' + $.escapeSelector(pid) + ']');
+              input.val(ab.latex());
+              math_validate_input(input);
           },
           enter: function() {},
         }
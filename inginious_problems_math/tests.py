@@ -1,10 +1,23 @@
 
 import unittest
+import json
+import logging
 import math
+import os
+import subprocess
 import sys
+import tempfile
+import time
 
-from sympy import simplify, sympify, N, E, pi, Equality, Interval, Matrix, FiniteSet, ConditionSet, EmptySet, S, Symbol
-from inginious_problems_math.math_problem import MathProblem
+from sympy import simplify, sympify, N, E, pi, Equality, Interval, Matrix, FiniteSet, ConditionSet, EmptySet, Range, S, Symbol, oo
+from sympy.parsing.latex import parse_latex
+from inginious_problems_math import fingerprint, latex_parser, metrics, numeric, sets
+from inginious_problems_math.cache import LRUCache, SizedLRUCache
+from inginious_problems_math.grading_pool import GradingPool
+from inginious_problems_math.regrade import regrade_task, update_user_tasks
+from inginious_problems_math import answer_stats, state
+from inginious_problems_math.verdict_store import VerdictStore
+from inginious_problems_math.math_problem import MathProblem, DisplayableMathProblem, parse_cache, rendered_inputs
 from inginious_problems_math.math_interval import MathIntervalProblem
 from inginious_problems_math.math_matrix import MathMatrixProblem
 from inginious_problems_math.math_set import MathSetProblem
@@ -169,8 +182,8 @@ class TestParseAnswer(unittest.TestCase):
         self.assertEqual(MathIntervalProblem.parse_answer("(0,x]").subs("x", 1), Interval(0, 1, True, False))
         self.assertEqual(MathIntervalProblem.parse_answer("[x_1,x_2]").subs([("x_{1}", 1), ("x_{2}", 2)]), Interval(1, 2, False, False))
         self.assertEqual(MathIntervalProblem.parse_answer("(x_1,x_2)").subs([("x_{1}", 1), ("x_{2}", 2)]), Interval(1, 2, True, True))
-        self.assertEqual(MathIntervalProblem.parse_answer("[x,\\infty]").subs("x", 1), Interval(1, sys.maxsize, False, False))
-        self.assertEqual(MathIntervalProblem.parse_answer("[x,\\infinity]").subs("x", 1), Interval(1, sys.maxsize, False, False))
+        self.assertEqual(MathIntervalProblem.parse_answer("[x,\\infty]").subs("x", 1), Interval(1, oo))
+        self.assertEqual(MathIntervalProblem.parse_answer("[x,\\infinity]").subs("x", 1), Interval(1, oo))
         self.assertEqual(MathIntervalProblem.parse_answer("[1,x+x]").subs("x", 1), Interval(1, 2, False, False))
         self.assertEqual(MathIntervalProblem.parse_answer("[1,x*x]").subs("x", 2), Interval(1, 4, False, False))
         self.assertEqual(MathIntervalProblem.parse_answer("[1,x*(x+1)]").subs("x", 1), Interval(1, 2, False, False))
@@ -393,6 +406,20 @@ class TestIsEqual(unittest.TestCase):
         self.assertFalse(test_instance.is_equal(MathIntervalProblem.parse_answer("[0,\\frac{\\sqrt{3}}{3})"), MathIntervalProblem.parse_answer("[0,\\frac{1}{\\sqrt{3}}]")))
         self.assertFalse(test_instance.is_equal(MathIntervalProblem.parse_answer("[0,\\frac{\\sqrt{3}}{3}]"), MathIntervalProblem.parse_answer("(0,\\frac{1}{\\sqrt{3}}]")))
 
+    def test_is_equal_math_interval_normalized(self):
+        self.assertEqual(MathIntervalProblem.parse_answer("[4,5]\\cup[0,1)\\cup[1]\\cup(3,2)"), Interval(0, 1).union(Interval(4, 5)))
+        self.assertEqual(MathIntervalProblem.parse_answer("(-\\infty,1]\\cup[0,\\infty]"), Interval(-oo, oo))
+        test_instance = MathIntervalProblem("fake_id", {}, "french", "fake_taskf")
+        union = "\\cup".join("[{},{}+\\frac{{1}}{{2}})".format(2 * i, 2 * i) for i in range(40))
+        shuffled = "\\cup".join("[{},{}.5)".format(2 * i, 2 * i) for i in reversed(range(40)))
+        self.assertTrue(test_instance.is_equal(MathIntervalProblem.parse_answer(union), MathIntervalProblem.parse_answer(shuffled)))
+        self.assertFalse(test_instance.is_equal(MathIntervalProblem.parse_answer(union), MathIntervalProblem.parse_answer(shuffled.replace(".5)", ".5]", 1))))
+        self.assertTrue(test_instance.is_equal(MathIntervalProblem.parse_answer("[\\frac{1}{\\sqrt{2}},\\pi)"), MathIntervalProblem.parse_answer("[\\frac{\\sqrt{2}}{2},\\pi)")))
+        self.assertFalse(test_instance.is_equal(MathIntervalProblem.parse_answer("[0.707,3.14)"), MathIntervalProblem.parse_answer("[\\frac{\\sqrt{2}}{2},\\pi)")))
+        test_instance = MathIntervalProblem("fake_id", {"tolerance": 0.01}, "french", "fake_taskf")
+        self.assertTrue(test_instance.is_equal(MathIntervalProblem.parse_answer("[0.707,3.14)"), MathIntervalProblem.parse_answer("[\\frac{\\sqrt{2}}{2},\\pi)")))
+        self.assertFalse(test_instance.is_equal(MathIntervalProblem.parse_answer("[0.707,3.14]"), MathIntervalProblem.parse_answer("[\\frac{\\sqrt{2}}{2},\\pi)")))
+
     def test_is_equal_math_matrix(self):
         test_instance = MathMatrixProblem("fake_id", {"fake_content": 5}, "french", "fake_taskf")
         self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("\\left[1,0\\right]"), MathMatrixProblem.parse_answer("\\left[1,0\\right]")))
@@ -408,6 +435,22 @@ class TestIsEqual(unittest.TestCase):
         self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("1,\\pi:0,0"), MathMatrixProblem.parse_answer("1,2\\pi-\\pi:0,0")))
         self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("\\frac{\\sqrt{3}}{3},0:0,0"), MathMatrixProblem.parse_answer("\\frac{1}{\\sqrt{3}},0:0,0")))
 
+    def test_is_equal_math_matrix_numeric(self):
+        self.assertEqual(MathMatrixProblem.parse_answer("-2,0.5:\\frac{1}{4},\\frac{-3}{2}"), Matrix([[-2, 0.5], [0.25, -1.5]]))
+        test_instance = MathMatrixProblem("fake_id", {"tolerance": 0.01}, "french", "fake_taskf")
+        self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("0.333,1:2,3"), MathMatrixProblem.parse_answer("\\frac{1}{3},1:2,3")))
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("0.3,1:2,3"), MathMatrixProblem.parse_answer("\\frac{1}{3},1:2,3")))
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("0.333,1,2,3"), MathMatrixProblem.parse_answer("\\frac{1}{3},1:2,3")))
+        test_instance = MathMatrixProblem("fake_id", {}, "french", "fake_taskf")
+        self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("0.5,1"), MathMatrixProblem.parse_answer("\\frac{1}{2},1")))
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("0.333,1"), MathMatrixProblem.parse_answer("\\frac{1}{3},1")))
+        # Exact elements are not rounded to floating point numbers
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("0.3333333333333333,1"), MathMatrixProblem.parse_answer("\\frac{1}{3},1")))
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("9007199254740993,1"), MathMatrixProblem.parse_answer("9007199254740992,1")))
+        # Symbolic elements are simplified when they do not match structurally
+        self.assertTrue(test_instance.is_equal(MathMatrixProblem.parse_answer("\\frac{x^2-1}{x-1},2"), MathMatrixProblem.parse_answer("x+1,2")))
+        self.assertFalse(test_instance.is_equal(MathMatrixProblem.parse_answer("\\frac{x^2-1}{x-1},2"), MathMatrixProblem.parse_answer("x-1,2")))
+
     def test_is_equal_set_explicit(self):
         test_instance = MathSetProblem("fake_id", {"fake_content": 5}, "french", "fake_taskf")
         self.assertTrue(test_instance.is_equal(MathSetProblem.parse_answer("{1,2,3}"), MathSetProblem.parse_answer("{3,2,1}")))
@@ -449,6 +492,792 @@ class TestIsEqual(unittest.TestCase):
         self.assertTrue(test_instance.is_equal(MathSetProblem.parse_answer("{x|(x<4+1)\\&(x>\\frac{6}{2})|N}"), MathSetProblem.parse_answer("{x|(x>3)\\&(x<5)|N}")))
 
 
+class TestSetMembership(unittest.TestCase):
+
+    def is_equal(self, answer, solution, **content):
+        test_instance = MathSetProblem("fake_id", content, "french", "fake_taskf")
+        return test_instance.is_equal(MathSetProblem.parse_answer(answer), MathSetProblem.parse_answer(solution))
+
+    def test_discrete_domains(self):
+        self.assertTrue(self.is_equal("{x|x^2<25|Z}", "{x|(x>-5)\\&(x<5)|Z}"))
+        self.assertTrue(self.is_equal("{x|x^2<25|Z}", "{-4,-3,-2,-1,0,1,2,3,4}"))
+        self.assertFalse(self.is_equal("{x|x^2\\le25|Z}", "{x|(x>-5)\\&(x<5)|Z}"))
+        self.assertTrue(self.is_equal("{x|x^2<25|Z-}", "{x|x>-5|Z-}"))
+        self.assertFalse(self.is_equal("{x|x<1000|N}", "{x|x<1001|N}", set_window=3))
+        self.assertTrue(self.is_equal("{x|3x<10|N}", "{x|x\\le3|N}"))
+        # The sets only differ beyond the window
+        self.assertFalse(self.is_equal("{x|x^2<50000|N}", "{x|x^3<11000000|N}"))
+        # Sets of integers within the window are equal when their exact membership agrees
+        x = Symbol("x")
+        self.assertTrue(sets.compare_by_membership(ConditionSet(x, x ** 2 < 25, Range(-10, 11)), FiniteSet(*range(-4, 5)), 10))
+        self.assertIsNone(sets.compare_by_membership(ConditionSet(x, x ** 2 < 25, Range(-10, 11)), FiniteSet(*range(-4, 5)), 5))
+
+    def test_real_domain(self):
+        self.assertTrue(self.is_equal("{x|x^2<2|R}", "{x|(x<\\sqrt{2})\\&(x>-\\sqrt{2})|R}"))
+        self.assertFalse(self.is_equal("{x|x^2<2|R}", "{x|(x<1.41)\\&(x>-1.41)|R}"))
+        # The sets only differ around the roots, which are not sampled
+        self.assertFalse(self.is_equal("{x|x^2<2|R}", "{x|(x<1.414214)\\&(x>-1.414214)|R}"))
+        self.assertFalse(self.is_equal("{x|x>5|R}", "{x|x\\ge5|R}"))
+        self.assertTrue(self.is_equal("{x|\\frac{x}{3}>\\frac{1}{3}|R}", "{x|x>1|R}"))
+
+    def test_fallback(self):
+        # Sets depending on other symbols are not sampled
+        self.assertTrue(self.is_equal("{x|x<a|N}", "{x|x<a|N}"))
+        self.assertTrue(self.is_equal("{x|x<a|N}", "{x|x<a|N}", set_fallback="simplify"))
+        test_instance = MathSetProblem("fake_id", {"set_window": 10, "set_fallback": "simplify"}, "french", "fake_taskf")
+        self.assertNotEqual(test_instance.get_answer_key_hash(), MathSetProblem("fake_id", {}, "french", "fake_taskf").get_answer_key_hash())
+
+    def test_explicit_keys(self):
+        fractions = "{" + ",".join("\\frac{{{}}}{{2}}".format(i) for i in range(200)) + "}"
+        decimals = "{" + ",".join("{}.5".format(i // 2) if i % 2 else str(i // 2) for i in reversed(range(200))) + "}"
+        self.assertTrue(self.is_equal(fractions, decimals))
+        self.assertFalse(self.is_equal(fractions, decimals.replace("99.5", "99.25")))
+        self.assertTrue(self.is_equal("{\\frac{1}{2},0.5,\\sqrt{4}}", "{2,\\frac{1}{2}}"))
+        self.assertTrue(self.is_equal("{\\frac{\\log{8}}{\\log{2}},x+x}", "{2x,3}"))
+        self.assertFalse(self.is_equal("{0.333333333333}", "{\\frac{1}{3}}"))
+        test_instance = MathSetProblem("fake_id", {}, "french", "fake_taskf")
+        self.assertEqual(test_instance.get_fingerprint(MathSetProblem.parse_answer(fractions)),
+                         test_instance.get_fingerprint(MathSetProblem.parse_answer(decimals)))
+
+
+class TestParseCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2})
+        cache.resize(1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_sized_eviction(self):
+        cache = SizedLRUCache(maxsize=10, maxbytes=10, sizeof=len)
+        cache.put("a", "1234")
+        cache.put("b", "1234")
+        cache.put("a", "12")
+        self.assertEqual(cache.stats()["bytes"], 6)
+        cache.put("c", "123456")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["bytes"], 8)
+        cache.resize(10, 7)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get("c"), "123456")
+
+    def test_parse_answer_is_memoized(self):
+        parse_cache.clear()
+        first = MathProblem.parse_answer("x_ab+1")
+        self.assertIs(MathProblem.parse_answer("x_{a}b+1"), first)
+        self.assertEqual(parse_cache.stats()["hits"], 1)
+        # The key includes the problem type
+        self.assertNotEqual(MathMatrixProblem.parse_answer("x_{a}b+1"), first)
+        self.assertEqual(MathMatrixProblem.parse_answer("\\left[1,2\\right]"), Matrix([[1, 2]]))
+
+
+class TestLatexParser(unittest.TestCase):
+
+    # Inputs in the subset of the hand-written parser, which must build the same expressions as parse_latex
+    supported = [
+        "3x^2+x+(2y+1)2y+4", "x_{12}+x_1y", "2\\pi* r_1", "-(a+b)", "127-2", "x--y", "2*-3", ".5x", "1,000x",
+        "2x3", "x(x+1)", "f_{1}(x,y)", "\\frac{1}{x}", "\\frac{x}{y}z", "x^2^3", "2^{x+1}", "e^{i\\pi}", "3!",
+        "\\sqrt{x+1}", "\\sqrt[3]{x}", "|x-1|+2", "\\binom{n}{k}", "\\lfloor x \\rfloor", "\\overline{z}",
+        "\\sin x y", "\\sin(x)y", "\\sin(x)^2", "\\sin{x}y", "\\sin x \\cdot y", "\\sin x\\cos x",
+        "\\sin^{-1}x", "\\cos^2(x)", "\\log_2 8", "\\log_{10}^2 x", "\\ln{x^{2}}", "\\arsinh(x)", "\\exp x",
+        "x\\times y\\div z:w", "\\{x\\}[x+1]", "x \\le 3", "x \\neq 1", "a=b", "\\infty", "\\alpha_1(x)",
+    ]
+
+    def test_same_expressions_as_parse_latex(self):
+        for latex_str in self.supported:
+            expected = parse_latex(latex_str)
+            self.assertEqual(latex_parser.parse(latex_str), expected, latex_str)
+            self.assertEqual(str(latex_parser.parse(latex_str)), str(expected), latex_str)
+
+    def test_unsupported_input(self):
+        for latex_str in ["\\int_0^1 x", "\\frac{d}{dx}x", "2dx", "x^-1", "x)", "(", "", "||x|-1|", "\\sin(x,y)"]:
+            self.assertRaises(latex_parser.UnsupportedLaTeX, latex_parser.parse, latex_str)
+        # parse_answer falls back to parse_latex
+        self.assertEqual(MathProblem.parse_answer("x+dx").free_symbols, {Symbol("x"), Symbol("dx")})
+
+
+class TestNumericCheck(unittest.TestCase):
+
+    # Equivalent answers taken from TestIsEqual, which the numerical pre-check must never reject
+    equivalent_answers = [
+        ("2x", "x-i^2x"), ("2x", "\\frac{2x^x}{x^{x-1}}"), ("2x", "x*2*\\frac{5x}{2+3x+4x-2x+1-3}"),
+        ("2x", "x+x*x_1*x_{12}-x*(x_1*x_{12}-1)"), ("\\frac{1}{\\sqrt{3}}", "\\frac{\\sqrt{3}}{3}"),
+        ("0.5", "\\frac{2x_1x_{12}}{4x_1x_{12}}"),
+        ("\\frac{e^{x}*(x-1)^2}{(x^2+1)^2}", "\\frac{e^x*(x^2+1-2*x)}{x^4+1+2*x^2}"),
+        ("\\log_{e}{x}", "\\ln{x}"), ("\\log_{z}{\\frac{2x^{3}}{5}}", "\\log_{z}{2} + 3*\\log_{z}{x} - \\log_{z}{5}"),
+        ("\\log{x} + \\log{y}", "\\log{xy}"), ("\\cos^2{x} + \\sin^2{x}", "1"),
+        ("\\tan{x+y}", "\\frac{\\tan{x} + \\tan{y}}{1-\\tan{x}\\tan{y}}"),
+        ("\\cos{x} - \\cos{y}", "-2\\sin{\\frac{x+y}{2}}\\sin{\\frac{x-y}{2}}"),
+    ]
+
+    def test_no_false_negative(self):
+        for use_complex in [False, True]:
+            for answer, solution in self.equivalent_answers:
+                if use_complex and "log" in answer:
+                    continue  # Logarithm identities only hold on the principal branch
+                values1 = numeric.evaluate(MathProblem.parse_answer(answer), MathProblem.numeric_samples, use_complex)
+                values2 = numeric.evaluate(MathProblem.parse_answer(solution), MathProblem.numeric_samples, use_complex)
+                self.assertFalse(numeric.differ(values1, values2), (answer, solution, use_complex))
+
+    def test_wrong_answer_skips_simplification(self):
+        test_instance = MathProblem("fake_id", {"fake_content": 5}, "french", "fake_taskf")
+        test_instance.canonicalize = lambda eq: self.fail("{} should not be simplified".format(eq))
+        self.assertFalse(test_instance.is_equal(MathProblem.parse_answer("2x+1"), MathProblem.parse_answer("x+x")))
+        self.assertFalse(test_instance.is_equal(MathProblem.parse_answer("\\sin{x}"), MathProblem.parse_answer("\\cos{x}")))
+
+    def test_undecidable_uses_symbolic_path(self):
+        test_instance = MathProblem("fake_id", {"fake_content": 5}, "french", "fake_taskf")
+        self.assertIsNone(test_instance.make_entry(MathProblem.parse_answer("x=2"))["values"])
+        self.assertTrue(test_instance.is_equal(MathProblem.parse_answer("x=2"), MathProblem.parse_answer("x=1+1")))
+        test_instance.numeric_samples = 0
+        self.assertIsNone(test_instance.make_entry(MathProblem.parse_answer("2x"))["values"])
+        self.assertFalse(test_instance.is_equal(MathProblem.parse_answer("2x+1"), MathProblem.parse_answer("x+x")))
+
+
+class TestCheckAnswer(unittest.TestCase):
+
+    def test_answer_key_is_compiled_once(self):
+        content = {"answers": ["2x"], "choices": [{"answer": "x", "feedback": "Forgot the factor"}]}
+        test_instance = MathProblem("fake_id", content, {}, "fake_taskf")
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+        answer_key = test_instance.get_answer_key()
+        other_instance = MathProblem("fake_id", dict(content), {}, "fake_taskf")
+        self.assertIs(other_instance.get_answer_key(), answer_key)
+        self.assertEqual(other_instance.check_answer({"fake_id": ["x"]}, "en")[2], ["Forgot the factor"])
+        self.assertFalse(other_instance.check_answer({"fake_id": ["3x"]}, "en")[0])
+
+    def test_answer_key_follows_content(self):
+        test_instance = MathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+        answer_key = test_instance.get_answer_key()
+        test_instance._answers = ["3x"]
+        self.assertIsNot(test_instance.get_answer_key(), answer_key)
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+2x"]}, "en")[0])
+
+    def test_answers_order(self):
+        test_instance = MathProblem("fake_id", {"answers": ["x+1", "2x"]}, {}, "fake_taskf")
+        self.assertTrue(test_instance.check_answer({"fake_id": ["\\frac{x^2-1}{x-1}", "x+x"]}, "en")[0])
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+x", "1+x"]}, "en")[0])
+        self.assertFalse(test_instance.check_answer({"fake_id": ["x+1", "\\frac{x^2-1}{x-1}"]}, "en")[0])
+        roots = ["\\frac{1}{2}", "-3", "\\sqrt{2}", "1-\\sqrt{2}"]
+        test_instance = MathProblem("fake_id", {"answers": roots}, {}, "fake_taskf")
+        self.assertTrue(test_instance.check_answer({"fake_id": ["\\frac{2}{\\sqrt{2}}", "0.5", "-\\frac{6}{2}", "-(\\sqrt{2}-1)"]}, "en")[0])
+        self.assertFalse(test_instance.check_answer({"fake_id": ["\\sqrt{2}", "0.5", "-3", "\\sqrt{2}-1"]}, "en")[0])
+
+    def test_choices_lookup(self):
+        choices = [{"answer": latex_str, "feedback": "Choice {}".format(i)}
+                   for i, latex_str in enumerate(["x", "3x", "x^2", "\\frac{x}{2}", "2x+1", "x<2", "x+2", "2"])]
+        test_instance = MathProblem("fake_id", {"answers": ["2x"], "choices": choices}, {}, "fake_taskf")
+        test_instance.get_answer_key()
+        calls = []
+        compare_entries = test_instance.compare_entries
+        test_instance.compare_entries = lambda entry1, entry2: calls.append(1) or compare_entries(entry1, entry2)
+        # Correct answers are not compared with the choices
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+        self.assertEqual(len(calls), 1)
+        # The other ones only with the choices they may be equal to, and the ones without fingerprint
+        del calls[:]
+        self.assertEqual(test_instance.check_answer({"fake_id": ["\\frac{1}{2}x"]}, "en")[2], ["Choice 3"])
+        self.assertEqual(len(calls), 1)
+        del calls[:]
+        self.assertFalse(test_instance.check_answer({"fake_id": ["x+5"]}, "en")[0])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(test_instance.check_answer({"fake_id": ["2+x"]}, "en")[2], ["Choice 6"])
+        self.assertFalse(test_instance.check_answer({"fake_id": ["4x"]}, "en")[0])
+
+    def test_match_entries(self):
+        test_instance = MathProblem("fake_id", {"answers": []}, {}, "fake_taskf")
+        correct_entries = [test_instance.make_entry(MathProblem.parse_answer(latex_str)) for latex_str in ["x", "2x", "x<2"]]
+        student_entries = [test_instance.make_entry(MathProblem.parse_answer(latex_str)) for latex_str in ["x<2", "x+x", "3x"]]
+        calls = []
+        compare_entries = test_instance.compare_entries
+        test_instance.compare_entries = lambda entry1, entry2: calls.append(1) or compare_entries(entry1, entry2)
+        self.assertEqual(test_instance.match_entries(student_entries, correct_entries), [2])
+        # Only the answers sharing a fingerprint, or without one, are compared
+        self.assertEqual(len(calls), 5)
+
+    def test_matrix_answers_order(self):
+        test_instance = MathMatrixProblem("fake_id", {"answers": ["1,2:3,4", "2x,1", "0,0,0"]}, {}, "fake_taskf")
+        self.assertTrue(test_instance.check_answer({"fake_id": ["0,0,0", "x+x,1", "1,2:3,4"]}, "en")[0])
+        self.assertTrue(test_instance.check_answer({"fake_id": ["3-3,0,0", "1,2:3,4", "2x,\\frac{2}{2}"]}, "en")[0])
+        self.assertFalse(test_instance.check_answer({"fake_id": ["0,0,0", "x,1", "1,2:3,4"]}, "en")[0])
+        answers = [MathMatrixProblem.parse_answer(latex_str) for latex_str in ["1,2:3,4", "2x,1", "0,0,0", "x+x,1"]]
+        sorted_answers = test_instance.sort(answers)
+        self.assertEqual([answer.shape for answer in sorted_answers], [(1, 2), (1, 2), (1, 3), (2, 2)])
+        self.assertEqual(test_instance.sort(reversed(answers)), sorted_answers)
+
+
+class SlowMathProblem(MathProblem):
+    """Math problem whose grading never ends for answers containing y"""
+
+    def grade(self, student_inputs):
+        while any("y" in eq for eq in student_inputs):
+            time.sleep(1)
+        return MathProblem.grade(self, student_inputs)
+
+
+class WorkerMathProblem(MathProblem):
+    """Math problem whose grading reports the process and the configuration it runs with"""
+
+    def grade(self, student_inputs):
+        return "correct", (os.getpid(), self.numeric_samples, parse_cache.stats()["maxsize"]), None
+
+
+class TestGradingPool(unittest.TestCase):
+
+    def test_deadline(self):
+        pool = GradingPool(workers=1, timeout=20)
+        try:
+            test_instance = SlowMathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+            test_instance.grading_pool = pool
+            self.assertTrue(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+            pool._timeout = 1
+            result = test_instance.check_answer({"fake_id": ["y"]}, "en")
+            self.assertFalse(result[0])
+            self.assertEqual(result[2], ["_wrong_answer", "Answer too complex to verify"])
+            # The worker has been replaced
+            pool._timeout = 20
+            self.assertEqual(test_instance.check_answer({"fake_id": ["3x"]}, "en")[2], ["_wrong_answer", "Not correct : :math:`3 x`"])
+        finally:
+            pool.close()
+
+    def test_busy(self):
+        pool = GradingPool(workers=1, timeout=1)
+        try:
+            test_instance = SlowMathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+            worker = pool._idle.get()
+            # No worker gets idle before the deadline
+            self.assertEqual(pool.grade(test_instance, ["x+x"]), ("timeout", None, None))
+            pool._idle.put(worker)
+        finally:
+            pool.close()
+
+    def test_workers(self):
+        pool = GradingPool(workers=1, timeout=20, max_checks=2, config={"numeric_samples": 3, "parse_cache_size": 7})
+        try:
+            test_instance = WorkerMathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+            details = [pool.grade(test_instance, ["x"])[1] for _ in range(3)]
+            # The workers apply the configuration, and are replaced after max_checks checks
+            self.assertEqual([detail[1:] for detail in details], [(3, 7)] * 3)
+            self.assertEqual(details[0][0], details[1][0])
+            self.assertNotEqual(details[1][0], details[2][0])
+        finally:
+            pool.close()
+
+
+class TestVerdictStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = VerdictStore(os.path.join(self.directory.name, "verdicts.sqlite"), max_entries=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_eviction(self):
+        for i in range(5):
+            self.store.put("hash", [str(i)], ["correct", None, "[]"])
+        self.assertEqual(self.store.get("hash", ["4"]), ("correct", None, "[]"))
+        self.assertIsNone(self.store.get("other_hash", ["4"]))
+        self.store.evict()
+        self.assertEqual(len(self.store), 3)
+        self.assertIsNone(self.store.get("hash", ["0"]))
+
+    def test_reads(self):
+        self.store.put("hash", ["x"], ["correct", None, None])
+        self.store.put("hash", ["y"], ["correct", None, None])
+        query = "SELECT used FROM verdicts ORDER BY key"
+        used = self.store._get_connection().execute(query).fetchall()
+        self.store.get("hash", ["x"])
+        # Reads do not write to the database, their use times are written in batches
+        self.assertEqual(self.store._get_connection().execute(query).fetchall(), used)
+        self.store.flush()
+        self.assertNotEqual(self.store._get_connection().execute(query).fetchall(), used)
+
+    def test_check_answer(self):
+        test_instance = MathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+        test_instance.verdict_store = self.store
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+        test_instance.grade = lambda student_inputs: self.fail("The verdict should be read from the store")
+        result = test_instance.check_answer({"fake_id": ["x+x"]}, "en")
+        self.assertTrue(result[0])
+        self.assertEqual(result[4]["inputs"], ["x+x"])
+        # Changing the answer key, or the numerical check, makes the stored verdicts unreachable
+        answer_key_hash = test_instance.get_answer_key_hash()
+        for option, value in [("numeric_rtol", 1e-3), ("numeric_atol", 1e-3), ("numeric_reject_ratio", 0.9)]:
+            setattr(test_instance, option, value)
+            self.assertNotEqual(test_instance.get_answer_key_hash(), answer_key_hash)
+            delattr(test_instance, option)
+        test_instance._answers = ["3x"]
+        self.assertRaises(AssertionError, test_instance.check_answer, {"fake_id": ["x+x"]}, "en")
+
+    def test_errors(self):
+        test_instance = MathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+        test_instance.verdict_store = self.store
+        test_instance.grade = lambda student_inputs: ("error", "MemoryError", None)
+        self.assertFalse(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+        # Errors may be transient and are not stored
+        self.assertEqual(len(self.store), 0)
+
+
+class TestRegrade(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import mongomock
+        except ImportError:
+            self.skipTest("mongomock is not installed")
+        self.database = mongomock.MongoClient().db
+        submissions = [("x+x", 0.0), ("2x", 0.0), ("2*x", 100.0), ("3x", 0.0), ("x+x", 0.0)]
+        self.database.submissions.insert_many([
+            {"courseid": "course", "taskid": "task", "status": "done", "grade": grade, "result": "failed",
+             "username": ["user{}".format(i % 2)], "submitted_on": i,
+             "input": {"fake_id": [answer], "@lang": "en"}, "problems": {"fake_id": ["failed", "Wrong answer"]}}
+            for i, (answer, grade) in enumerate(submissions)])
+        self.database.user_tasks.insert_many([{"courseid": "course", "taskid": "task", "username": "user" + str(i),
+                                               "grade": 0.0, "succeeded": False} for i in range(2)])
+        self.problems = [MathProblem("fake_id", {"answers": ["2x"]}, {}, None)]
+
+    def test_dry_run(self):
+        self.assertEqual(regrade_task(self.database, None, "course", "task", self.problems, dry_run=True), (5, 4, 5))
+        self.assertEqual(self.database.submissions.count_documents({"grade": 100.0}), 1)
+
+    def test_regrade(self):
+        self.assertEqual(regrade_task(self.database, None, "course", "task", self.problems, batch_size=2), (5, 4, 5))
+        self.assertEqual(self.database.submissions.count_documents({"grade": 100.0, "result": "success"}), 4)
+        wrong = self.database.submissions.find_one({"input.fake_id": "3x"})
+        self.assertEqual(wrong["problems"]["fake_id"], ["failed", "Wrong answer\n\nNot correct : :math:`3 x`"])
+        # Nothing changes on a second run
+        self.assertEqual(regrade_task(self.database, None, "course", "task", self.problems)[2], 0)
+        # The grades of the students are updated
+        user_task = self.database.user_tasks.find_one({"username": "user1"})
+        self.assertEqual((user_task["grade"], user_task["succeeded"]), (100.0, True))
+        self.assertEqual(self.database.submissions.find_one({"_id": user_task["submissionid"]})["input"]["fake_id"], ["2x"])
+        update_user_tasks(self.database, "course", "task", ["user1"], evaluation_mode="last")
+        self.assertEqual(self.database.user_tasks.find_one({"username": "user1"})["grade"], 0.0)
+
+    def test_timeout(self):
+        pool = TimeoutPool()
+        self.assertEqual(regrade_task(self.database, None, "course", "task", self.problems, pool, batch_size=2), (5, 4, 4))
+        # The submission whose check timed out keeps its grade
+        self.assertEqual(self.database.submissions.find_one({"input.fake_id": "2*x"})["grade"], 100.0)
+        self.assertEqual(self.database.user_tasks.find_one({"username": "user0"})["grade"], 100.0)
+
+
+class TimeoutPool(object):
+    """Grading pool whose checks of answers written with * time out"""
+
+    def grade(self, problem, student_inputs):
+        if any("*" in eq for eq in student_inputs):
+            return "timeout", None, None
+        return problem.grade(student_inputs)
+
+
+class FakeTask(object):
+
+    def __init__(self, problems):
+        self._problems = problems
+
+    def get_id(self):
+        return "task"
+
+    def get_problems(self):
+        return self._problems
+
+    def get_task(self, courseid, taskid):
+        return self
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def get_fingerprint(self, latex_str):
+        return fingerprint.get_fingerprint(MathProblem.parse_answer(latex_str))
+
+    def test_equal_answers(self):
+        for answer, solution in [("2x", "x+x"), ("\\frac{x^2-1}{x-1}", "x+1"), ("\\cos^2{x}+\\sin^2{x}", "1"),
+                                 ("\\log{xy}", "\\log{x}+\\log{y}"), ("\\frac{1}{\\sqrt{3}}", "\\frac{\\sqrt{3}}{3}"),
+                                 ("0.5x", "\\frac{x}{2}"), ("\\log_{2}{8}", "3")]:
+            self.assertEqual(self.get_fingerprint(answer).key, self.get_fingerprint(solution).key, answer)
+            self.assertTrue(fingerprint.may_be_equal(self.get_fingerprint(answer), self.get_fingerprint(solution)))
+
+    def test_different_answers(self):
+        for answer, solution in [("2x", "3x"), ("x^2", "x^3"), ("\\sin{x}", "\\cos{x}"), ("x", "y")]:
+            self.assertFalse(fingerprint.may_be_equal(self.get_fingerprint(answer), self.get_fingerprint(solution)))
+        # The rounded values collide, the exact residues tell the rational functions apart
+        fingerprint1, fingerprint2 = self.get_fingerprint("x"), self.get_fingerprint("x+\\frac{1}{10^{20}}")
+        self.assertEqual(fingerprint1.key, fingerprint2.key)
+        self.assertFalse(fingerprint.may_be_equal(fingerprint1, fingerprint2))
+
+    def test_unknown(self):
+        self.assertIsNone(self.get_fingerprint("x<2"))
+        self.assertIsNone(self.get_fingerprint("\\frac{1}{x-x}"))
+        self.assertIsNone(MathProblem("fake_id", {"answers": ["2x"], "tolerance": 0.1}, {}, None).get_fingerprint(
+            MathProblem.parse_answer("2x")))
+
+    def test_index(self):
+        index = fingerprint.FingerprintIndex()
+        for i, latex_str in enumerate(["2x", "x<2", "3x", "x+x", "1"]):
+            index.add(self.get_fingerprint(latex_str), i)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.candidates(self.get_fingerprint("x2")), [0, 1, 3])
+        self.assertEqual(index.candidates(self.get_fingerprint("\\cos^2{x}+\\sin^2{x}")), [1, 4])
+        self.assertEqual(index.candidates(None), [0, 1, 2, 3, 4])
+
+
+class TestState(unittest.TestCase):
+
+    def test_grade(self):
+        test_instance = MathProblem("fake_id", {"answers": ["2x"]}, {}, None)
+        verdict, _, state1 = test_instance.grade(["x+x"])
+        self.assertEqual(verdict, "correct")
+        self.assertEqual(state1["inputs"], ["x+x"])
+        # The inputs are normalized, not printed from the parsed answers
+        self.assertEqual(test_instance.grade(["\\left|x\\right|"])[2]["inputs"], ["|x|"])
+        self.assertEqual(json.loads(json.dumps(state1)), state1)
+        # Equivalent answers share their key, whatever their form
+        self.assertEqual(test_instance.grade(["2\\cdot x"])[2]["key"], state1["key"])
+        self.assertNotEqual(test_instance.grade(["3x"])[2]["key"], state1["key"])
+        self.assertIsNone(test_instance.grade(["\\frac{"])[2])
+        # Answers without fingerprint have no key
+        self.assertIsNone(test_instance.grade(["x<2"])[2]["key"])
+
+    def test_read_state(self):
+        current = state.make_state(["y", "2x"], None)
+        self.assertEqual(current, {"v": state.version, "inputs": ["2x", "y"], "key": None})
+        self.assertIs(state.read_state(current), current)
+        # States of the first version are migrated
+        self.assertEqual(state.read_state('["2 x", "y"]'), {"v": state.version, "inputs": ["2 x", "y"], "key": None})
+        self.assertEqual(state.get_answer(state.read_state('["2 x", "y"]')), '["2 x", "y"]')
+        for invalid in [None, "", "[]", "[", '{"a": 1}', "[1]", {"v": 1, "inputs": ["x"]}, {"v": state.version}]:
+            self.assertIsNone(state.read_state(invalid), invalid)
+
+
+class TestAnswerStats(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import mongomock
+        except ImportError:
+            self.skipTest("mongomock is not installed")
+        self.database = mongomock.MongoClient().db
+        answer_stats.create_indexes(self.database)
+        self.task = FakeTask([MathProblem("fake_id", {"answers": ["2x"]}, {}, None), FakeTask([])])
+        self.task.get_problems()[1].get_id = lambda: "other_id"
+        self.states = ['["2 x"]', '["x + x"]', '["2 x"]', '["3 x"]', '["2 x"]', '["x + x"]']
+        for i, submission_state in enumerate(self.states):
+            self.database.submissions.insert_one({
+                "courseid": "course", "taskid": "task", "status": "done",
+                "state": json.dumps({"fake_id": submission_state, "other_id": "ignored"}) if i else ""})
+
+    def test_submission_done(self):
+        for submission in self.database.submissions.find():
+            answer_stats.submission_done(self.database, self.task, submission, True)
+            # Replayed submissions are not counted twice
+            answer_stats.submission_done(self.database, self.task, submission, False)
+        # The answers are clustered in the background
+        answer_stats.clustering_executor.submit(lambda: None).result()
+        top_answers = answer_stats.get_top_answers(self.database, "course", limit=2)
+        self.assertEqual(top_answers, {"task": {"fake_id": [('["x + x"]', 4, ['["2 x"]', '["x + x"]']), ('["3 x"]', 1, ['["3 x"]'])]}})
+        self.assertEqual(answer_stats.get_top_answers(self.database, "other_course"), {})
+        self.assertEqual(answer_stats.get_top_answers(self.database, "course", ["other_task"]), {})
+        # The variants of a cluster are capped, the most frequent first
+        top_answers = answer_stats.get_top_answers(self.database, "course", ["task"], limit=1, variant_limit=1)
+        self.assertEqual(top_answers["task"]["fake_id"], [('["x + x"]', 4, ['["2 x"]'])])
+
+    def test_backfill(self):
+        self.assertEqual(answer_stats.backfill_task(self.database, "course", "task", ["fake_id"], batch_size=2), 6)
+        expected = [('["2 x"]', 2, ['["2 x"]']), ('["x + x"]', 2, ['["x + x"]']), ('["3 x"]', 1, ['["3 x"]'])]
+        self.assertEqual(sorted(answer_stats.get_top_answers(self.database, "course")["task"]["fake_id"]), sorted(expected))
+        # Running it again rebuilds the same counters
+        answer_stats.backfill_task(self.database, "course", "task", ["fake_id"])
+        self.assertEqual(self.database[answer_stats.collection_name].count_documents({}), 3)
+
+    def test_current_states(self):
+        test_instance = self.task.get_problems()[0]
+        states = [test_instance.grade([latex_str])[2] for latex_str in ["x+x", "2\\cdot x", "x+x"]]
+        for answer in states:
+            answer_stats.add_answers(self.database, "course", "task", {"fake_id": answer})
+        answer_stats.add_answers(self.database, "course", "task", {"fake_id": '["x+x"]'})
+        collection = self.database[answer_stats.collection_name]
+        self.assertEqual(collection.find_one({"answer": '["x+x"]'}, {"_id": 0, "count": 1, "inputs": 1, "key": 1}),
+                         {"count": 3, "inputs": ["x+x"], "key": states[0]["key"]})
+        # The answers are queried by their key without being decoded
+        self.assertEqual(collection.count_documents({"key": states[0]["key"]}), 2)
+        self.assertEqual(collection.count_documents({"inputs": "2\\cdot x"}), 1)
+
+    def test_kept_states(self):
+        test_instance = self.task.get_problems()[0]
+        task_state = json.dumps({"fake_id": test_instance.grade(["x+x"])[2]})
+        # An answer that cannot be parsed keeps the previous state, which is not counted again
+        kept = test_instance.check_answer({"fake_id": ["\\frac{"], "@state": task_state}, "en")[4]
+        self.assertTrue(kept["kept"])
+        self.assertEqual(kept["inputs"], ["x+x"])
+        self.assertEqual(answer_stats.get_answers(json.dumps({"fake_id": kept}), ["fake_id"]), {})
+        self.assertEqual(test_instance.check_answer({"fake_id": ["\\frac{"], "@state": "{}"}, "en")[4], "")
+        fresh = test_instance.check_answer({"fake_id": ["2x"], "@state": json.dumps({"fake_id": kept})}, "en")[4]
+        self.assertEqual(answer_stats.get_answers(json.dumps({"fake_id": fresh}), ["fake_id"]), {"fake_id": fresh})
+
+    def test_cluster_answers(self):
+        answer_stats.backfill_task(self.database, "course", "task", ["fake_id"])
+        answer_stats.add_answers(self.database, "course", "task", {"fake_id": '["\\\\frac{x}{1}+x"]'})
+        answer_stats.add_answers(self.database, "course", "task", {"fake_id": '["\\\\frac{"]'})
+        problems = {"task": [self.task.get_problems()[0]]}
+        self.assertEqual(answer_stats.cluster_answers(self.database, "course", problems), 5)
+        top_answers = answer_stats.get_top_answers(self.database, "course")["task"]["fake_id"]
+        self.assertEqual(top_answers, [('["2 x"]', 5, ['["2 x"]', '["\\\\frac{x}{1}+x"]', '["x + x"]']),
+                                       ('["3 x"]', 1, ['["3 x"]']), ('["\\\\frac{"]', 1, ['["\\\\frac{"]'])])
+        # The clusters are kept, only the new answers are assigned to one
+        self.assertEqual(answer_stats.cluster_answers(self.database, "course", problems), 0)
+        answer_stats.add_answers(self.database, "course", "task", {"fake_id": '["3 x"]'})
+        answer_stats.add_answers(self.database, "course", "task", {"fake_id": '["x+2x"]'})
+        self.assertEqual(answer_stats.cluster_answers(self.database, "course", problems), 1)
+        top_answers = answer_stats.get_top_answers(self.database, "course", limit=2)["task"]["fake_id"]
+        self.assertEqual(top_answers[1], ('["3 x"]', 3, ['["3 x"]', '["x+2x"]']))
+        # Other comparison settings invalidate them
+        problems = {"task": [MathProblem("fake_id", {"answers": ["2x"], "comparison_type": "perfect_match"}, {}, None)]}
+        self.assertEqual(answer_stats.cluster_answers(self.database, "course", problems), 6)
+        top_answers = answer_stats.get_top_answers(self.database, "course", limit=10)["task"]["fake_id"]
+        self.assertEqual(len(top_answers), 6)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def tearDown(self):
+        metrics.set_sink(None)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(metrics.sink)
+        self.assertIs(metrics.timer("parse_latex"), metrics.timer("simplify"))
+
+    def test_histogram(self):
+        sink = metrics.HistogramSink(buckets=[0.5, 1000])
+        metrics.set_sink(sink)
+        parse_cache.clear()
+        test_instance = MathProblem("fake_id", {"answers": ["2x"]}, {}, "fake_taskf")
+        self.assertTrue(test_instance.check_answer({"fake_id": ["x+x"]}, "en")[0])
+        histograms, counters = sink.snapshot()
+        for stage in ["check_answer", "normalize", "parse_latex", "sympify", "sort", "state", "numeric", "simplify", "compare"]:
+            self.assertIn(stage, histograms)
+        self.assertEqual(histograms["check_answer"]["count"], 1)
+        self.assertEqual(sum(histograms["check_answer"]["buckets"]), 1)
+        self.assertEqual(counters, {("verdict", "correct"): 1})
+        text = sink.to_prometheus()
+        self.assertIn('inginious_math_stage_seconds_bucket{stage="check_answer",le="+Inf"} 1', text)
+        self.assertIn('inginious_math_stage_seconds_count{stage="check_answer"} 1', text)
+        self.assertIn('inginious_math_outcomes_total{name="verdict",value="correct"} 1', text)
+
+    def test_logging(self):
+        metrics.set_sink(metrics.LoggingSink(logging.INFO))
+        with self.assertLogs("inginious.webapp.plugin.math.metrics", logging.INFO) as logs:
+            with metrics.timer("simplify"):
+                pass
+            metrics.count("verdict", "wrong")
+        self.assertEqual(logs.records[0].stage, "simplify")
+        self.assertGreaterEqual(logs.records[0].duration, 0)
+        self.assertEqual((logs.records[1].counter, logs.records[1].value), ("verdict", "wrong"))
+
+    def test_page(self):
+        import ipaddress
+        from types import SimpleNamespace
+        from flask import Flask
+        from inginious_problems_math.pages.metrics import MetricsPage
+        metrics.set_sink(metrics.HistogramSink())
+        app = Flask(__name__)
+        superadmin = []
+        app.user_manager = SimpleNamespace(session_language=lambda default=None: "en", session_logged_in=lambda: True,
+                                           user_is_superadmin=lambda: bool(superadmin))
+        app.l10n_manager = SimpleNamespace(translations={"en": None})
+        app.add_url_rule("/plugins/math/metrics", view_func=MetricsPage.as_view("mathmetricspage"))
+        client = app.test_client()
+        MetricsPage.token, MetricsPage.allowed_networks = "secret", [ipaddress.ip_network("10.0.0.0/8")]
+        try:
+            # Students and other addresses are refused
+            self.assertEqual(client.get("/plugins/math/metrics").status_code, 403)
+            self.assertEqual(client.get("/plugins/math/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            self.assertEqual(client.get("/plugins/math/metrics", headers={"Authorization": "Bearer secret"}).status_code, 200)
+            self.assertEqual(client.get("/plugins/math/metrics", environ_base={"REMOTE_ADDR": "10.1.2.3"}).status_code, 200)
+            superadmin.append(True)
+            self.assertEqual(client.get("/plugins/math/metrics").status_code, 200)
+        finally:
+            MetricsPage.token, MetricsPage.allowed_networks = None, []
+            metrics.set_sink(None)
+
+
+class TestDisplay(unittest.TestCase):
+
+    def test_show_input_cache(self):
+        renders = []
+
+        class TemplateHelper(object):
+            homepath = "http://host"
+
+            def render(self, template, **kwargs):
+                renders.append(template)
+                if template == "math_script.html":
+                    return "<script>homepath = '{}';</script>".format(self.homepath)
+                return str(kwargs["header"])
+
+        rendered_inputs.clear()
+        problem = DisplayableMathProblem("p1", {"answers": ["2x"], "header": "Compute *this*"}, {}, None)
+        rendered = problem.show_input(TemplateHelper(), "en", 0)
+        self.assertIn("<em>this</em>", rendered)
+        self.assertEqual(problem.show_input(TemplateHelper(), "en", 1), rendered)
+        self.assertEqual(renders.count("math.html"), 1)
+        # The URL of the request is not cached
+        TemplateHelper.homepath = "https://other/inginious"
+        self.assertIn("https://other/inginious", problem.show_input(TemplateHelper(), "en", 1))
+        self.assertEqual(renders.count("math.html"), 1)
+        # Editing the header renders it again
+        edited = DisplayableMathProblem("p1", {"answers": ["2x"], "header": "Compute *that*"}, {}, None)
+        self.assertIn("<em>that</em>", edited.show_input(TemplateHelper(), "en", 0))
+        self.assertEqual(renders.count("math.html"), 2)
+
+    def test_render_cache(self):
+        from inginious_problems_math.pages.hint import hint_cache, problem_indexes, render_hints
+        hint_cache.clear()
+        problem_indexes.clear()
+        problem = MathProblem("p1", {"answers": ["2x"], "hints": "Try *harder*"}, {}, None)
+        task = FakeTask([MathProblem("p0", {"answers": ["x"]}, {}, None), problem])
+        hints, etag = render_hints("course", task, 1, "p1", "en")
+        self.assertIn("<em>harder</em>", hints)
+        problem._hints = "Edited"
+        self.assertEqual(render_hints("course", task, 1, "p1", "en"), (hints, etag))
+        # A new revision of the task renders the hints again
+        edited, edited_etag = render_hints("course", task, 2, "p1", "en")
+        self.assertIn("Edited", edited)
+        self.assertNotEqual(edited_etag, etag)
+        self.assertEqual(render_hints("course", task, 2, "unknown", "en")[0], "")
+        self.assertEqual(len(problem_indexes), 2)
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        from inginious_problems_math.assets import Assets
+        self.directory = tempfile.TemporaryDirectory()
+        self.assets = Assets(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_build(self):
+        import gzip
+        css = self.assets.get_name("math.css")
+        with open(os.path.join(self.directory.name, css), encoding="utf-8") as file:
+            content = file.read()
+        self.assertIn("url(" + self.assets.get_name("font/Symbola.ttf") + ")", content)
+        self.assertNotIn("url(font/Symbola.ttf)", content)
+        with open(os.path.join(self.directory.name, css + ".gz"), "rb") as file:
+            self.assertEqual(gzip.decompress(file.read()).decode("utf-8"), content)
+        self.assertEqual(self.assets.files[self.assets.get_name("font/Symbola.woff2")], ["identity"])
+        # Building again keeps the same files
+        from inginious_problems_math.assets import Assets
+        self.assertEqual(Assets(self.directory.name).names, self.assets.names)
+
+    def test_tampered(self):
+        import gzip
+        from inginious_problems_math.assets import Assets
+        js = self.assets.get_name("math.js")
+        with open(os.path.join(self.directory.name, js), "rb") as file:
+            content = file.read()
+        for filename, planted in [(js, b"alert(1)"), (js + ".gz", gzip.compress(b"alert(1)"))]:
+            with open(os.path.join(self.directory.name, filename), "wb") as file:
+                file.write(planted)
+        # The planted files are replaced by the built ones
+        Assets(self.directory.name)
+        with open(os.path.join(self.directory.name, js), "rb") as file:
+            self.assertEqual(file.read(), content)
+        with open(os.path.join(self.directory.name, js + ".gz"), "rb") as file:
+            self.assertEqual(gzip.decompress(file.read()), content)
+        # A directory writable by the other users is refused
+        os.chmod(self.directory.name, 0o777)
+        self.assertRaises(PermissionError, Assets, self.directory.name)
+
+    def test_page(self):
+        from flask import Flask
+        from inginious_problems_math.pages.assets import AssetPage
+        AssetPage.assets = self.assets
+        app = Flask(__name__)
+        app.add_url_rule("/plugins/math/assets/<filename>", view_func=AssetPage.as_view("mathassetpage"))
+        client = app.test_client()
+        url = "/plugins/math/assets/" + self.assets.get_name("math.js")
+        response = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertEqual(client.get(url, headers={"Accept-Encoding": "gzip",
+                                                  "If-None-Match": response.headers["ETag"]}).status_code, 304)
+        self.assertNotIn("Content-Encoding", client.get(url, headers={"Accept-Encoding": "identity"}).headers)
+        self.assertEqual(client.get("/plugins/math/assets/math.js").status_code, 404)
+
+
+class TestStartup(unittest.TestCase):
+
+    heavy_modules = ["sympy", "numpy", "mpmath", "antlr4"]
+    # Budget of the modules of the plugin itself, dependencies excluded, in microseconds
+    import_budget = 200000
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    # Registers and displays the problems, then prints the heavy modules loaded
+    display_script = """
+import sys
+import inginious_problems_math
+from inginious_problems_math.math_problem import DisplayableMathProblem
+from inginious_problems_math.math_matrix import DisplayableMathMatrixProblem
+from inginious_problems_math.math_interval import DisplayableMathIntervalProblem
+from inginious_problems_math.math_set import DisplayableMathSetProblem
+
+class FakeCollection(object):
+    def create_index(self, *args, **kwargs): pass
+
+class FakeManager(object):
+    problem_types = []
+    def get_database(self): return {"math_answers": FakeCollection()}
+    def add_page(self, *args): pass
+    def add_hook(self, *args): pass
+    def get_task_factory(self): return self
+    def add_problem_type(self, problem_type): self.problem_types.append(problem_type)
+
+class FakeTemplateHelper(object):
+    def render(self, template, **kwargs): return template
+
+manager = FakeManager()
+inginious_problems_math.init(manager, manager, None, {})
+assert len(manager.problem_types) == 4
+for problem_type in manager.problem_types:
+    problem = problem_type("fake_id", {"header": "Header", "answers": ["2x"]}, {}, None)
+    problem.show_input(FakeTemplateHelper(), "en", 0)
+    problem_type.show_editbox(FakeTemplateHelper(), "fake_id", "en")
+print(",".join(module for module in %r if module in sys.modules))
+"""
+
+    def test_import_time(self):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import inginious_problems_math"],
+                                cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                check=True)
+        plugin_time = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_time, __, module = line[len("import time:"):].split("|")
+            module = module.strip()
+            self.assertNotIn(module.split(".")[0], self.heavy_modules)
+            if module.startswith("inginious_problems_math"):
+                plugin_time += int(self_time)
+        self.assertLess(plugin_time, self.import_budget)
+
+    def test_display_without_sympy(self):
+        result = subprocess.run([sys.executable, "-c", self.display_script % self.heavy_modules], cwd=self.root,
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+
 if __name__ == '__main__':
     unittest.main()
 
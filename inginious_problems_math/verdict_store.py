@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Verdicts of MathProblem.grade, persisted in a SQLite database shared by the processes of a node """
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# Bumped when the grading code changes in a way that invalidates the stored verdicts
+STORE_VERSION = 2
+# Number of reads whose use time is kept in memory before being written to the database
+touch_batch_size = 100
+
+
+class VerdictStore(object):
+    """Maps (answer key hash, normalized student inputs) to the verdict returned by MathProblem.grade.
+    The database is in WAL mode so that several processes can read it while one writes. When it holds
+    more than max_entries verdicts, the least recently used ones are evicted. Reads do not write to the database:
+    the use times of the verdicts read are kept in memory, and written in batches"""
+
+    def __init__(self, path, max_entries=100000):
+        self._logger = logging.getLogger("inginious.webapp.plugin.math")
+        self._path = path
+        self._max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+        connection = self._get_connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict TEXT NOT NULL, "
+                           "used REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS verdicts_used ON verdicts (used)")
+        connection.commit()
+
+    def _get_connection(self):
+        # SQLite connections cannot be shared between threads
+        if not hasattr(self._local, "connection"):
+            self._local.connection = sqlite3.connect(self._path, timeout=5)
+        return self._local.connection
+
+    @staticmethod
+    def make_key(answer_key_hash, student_inputs):
+        content = json.dumps([STORE_VERSION, answer_key_hash, list(student_inputs)])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, answer_key_hash, student_inputs):
+        """Returns the stored verdict, as a (verdict, detail, state) tuple, or None"""
+        key = self.make_key(answer_key_hash, student_inputs)
+        try:
+            connection = self._get_connection()
+            row = connection.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._lock:
+                self._touched[key] = time.time()
+                flush = len(self._touched) >= touch_batch_size
+            if flush:
+                self.flush()
+            return tuple(json.loads(row[0]))
+        except sqlite3.Error as e:
+            self._logger.warning("Cannot read the math verdict store: %s", e)
+            return None
+
+    def put(self, answer_key_hash, student_inputs, verdict):
+        """Stores a verdict returned by MathProblem.grade"""
+        key = self.make_key(answer_key_hash, student_inputs)
+        try:
+            connection = self._get_connection()
+            connection.execute("INSERT OR REPLACE INTO verdicts (key, verdict, used) VALUES (?, ?, ?)",
+                               (key, json.dumps(verdict), time.time()))
+            # The pending use times are written in the same transaction
+            self.flush()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            self._logger.warning("Cannot write to the math verdict store: %s", e)
+
+    def flush(self):
+        """Writes the use times of the verdicts read since the last flush"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        connection = self._get_connection()
+        if touched:
+            connection.executemany("UPDATE verdicts SET used = ? WHERE key = ?",
+                                   [(used, key) for key, used in touched.items()])
+        connection.commit()
+
+    def evict(self):
+        """Removes the least recently used verdicts above max_entries"""
+        self.flush()
+        connection = self._get_connection()
+        count = connection.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if count > self._max_entries:
+            connection.execute("DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY used LIMIT ?)",
+                               (count - self._max_entries,))
+            connection.commit()
+
+    def __len__(self):
+        return self._get_connection().execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
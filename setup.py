@@ -8,10 +8,13 @@ setup(
     version="0.1dev0",
     description="Plugin to add math formulas problem type",
     packages=find_packages(),
-    install_requires=["inginious>=0.5.dev0", "sympy", "antlr4-python3-runtime"],
-    tests_require=[],
-    extras_require={},
+    install_requires=["inginious>=0.5.dev0", "sympy", "antlr4-python3-runtime", "numpy"],
+    tests_require=["mongomock"],
+    extras_require={"brotli": ["brotli"]},
     scripts=[],
+    entry_points={"console_scripts": ["inginious-math-regrade = inginious_problems_math.regrade:main",
+                                      "inginious-math-answers-backfill = inginious_problems_math.answer_stats:main",
+                                      "inginious-math-assets = inginious_problems_math.assets:main"]},
     include_package_data=True,
     author="The INGInious authors",
     author_email="inginious@info.ucl.ac.be",